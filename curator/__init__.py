@@ -1,15 +1,21 @@
 # Imports
 from .analysis import *
+from .cache import *
 from .database import *
+from .journal import *
 from .media import *
 from .plan import *
+from .query import *
 from .stream import *
 from .task import *
 
 # Prevent polluting namespace
 del analysis
+del cache
 del database
+del journal
 del media
 del plan
+del query
 del stream
 del task
@@ -0,0 +1,251 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from .database import Database
+from .query import flatten_info, parse_number
+
+def file_identity(path, stat=None):
+    """
+    Cheap identity of a file, changing whenever its contents are likely to have changed.
+    """
+    if stat is None:
+        stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+class ProbeCache(Database):
+    """
+    Persistent cache of ffprobe and native probe results stored as SQLite database.
+    Entries are keyed by path and invalidated if the size, mtime or inode of the file change.
+    """
+    def __init__(self, refresh=False):
+        super().__init__("probe")
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.cache, 'probe.sqlite'),
+            check_same_thread=False)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS probe (
+                    path TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (path, kind))''')
+            # Flattened information of probed media (stream -1) and streams
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS probe_values (
+                    path TEXT NOT NULL,
+                    stream INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    num REAL)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS probe_values_path ON probe_values (path)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS probe_values_value ON probe_values (key, value)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS probe_values_num ON probe_values (key, num)')
+            # Complete keys of partially probed media (stream -1) and streams
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS probe_keys (
+                    path TEXT NOT NULL,
+                    stream INTEGER NOT NULL,
+                    key TEXT NOT NULL)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS probe_keys_path ON probe_keys (path)')
+            self.conn.commit()
+        self.conn.create_function('REGEXP', 2,
+            lambda pattern, value: value is not None and re.search(pattern, value) is not None)
+
+    def get(self, path, kind, stat=None):
+        if self.refresh:
+            return None
+        path = os.path.abspath(path)
+        try:
+            identity = file_identity(path, stat)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime, inode, data FROM probe WHERE path=? AND kind=?',
+                (path, kind)).fetchone()
+        if row is None or tuple(row[:3]) != identity:
+            return None
+        return json.loads(row[3])
+
+    def put(self, path, kind, data, stat=None):
+        path = os.path.abspath(path)
+        try:
+            identity = file_identity(path, stat)
+        except OSError:
+            return
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?, ?, ?)',
+                (path, kind, *identity, json.dumps(data)))
+            if kind == 'probe':
+                self.conn.execute('DELETE FROM probe_values WHERE path=?', (path,))
+                self.conn.execute('DELETE FROM probe_keys WHERE path=?', (path,))
+                # Partial probes, e.g. from native parsing, only answer queries on their complete keys
+                complete = data.get('complete')
+                if 'source' not in data or complete:
+                    self.conn.executemany('INSERT INTO probe_values VALUES (?, ?, ?, ?, ?)',
+                        self.probe_values(path, data))
+                if 'source' in data and complete:
+                    keys = [(path, -1, key) for key in complete.get('format', [])]
+                    keys += [(path, 0, key) for key in complete.get('streams', [])]
+                    self.conn.executemany('INSERT INTO probe_keys VALUES (?, ?, ?)', keys)
+            self.conn.commit()
+
+    @staticmethod
+    def probe_values(path, probe):
+        infos = [(-1, probe.get('format', {}))]
+        infos += [(s.get('index', i), s) for i, s in enumerate(probe.get('streams', []))]
+        for stream, info in infos:
+            for key, value in flatten_info(info):
+                number = parse_number(value) if value is not None else None
+                yield path, stream, key, None if value is None else str(value), number
+
+    @staticmethod
+    def complete_key(query, keys):
+        prefixes = ['.'.join(query.path[:i]) for i in range(1, len(query.path) + 1)]
+        return any((query.media_level, prefix) in keys for prefix in prefixes)
+
+    def select(self, queries):
+        """
+        Evaluate queries over all cached media without opening any file.
+        Returns the identities of all indexed media, and the paths of those matching.
+        Stream-level queries must be satisfied by the same stream, as in `filter_check`.
+        """
+        media_selects, stream_selects = [], []
+        media_params, stream_params = [], []
+        for query in queries:
+            level = 'stream = -1' if query.media_level else 'stream >= 0'
+            columns = 'path' if query.media_level else 'path, stream'
+            condition, params = query.sql()
+            select = f'SELECT {columns} FROM probe_values WHERE {level} AND {condition}'
+            if query.op == '!':
+                select = f'SELECT {columns} FROM probe_values WHERE {level} EXCEPT {select}'
+            select = f'SELECT {columns} FROM ({select})'
+            if query.media_level:
+                media_selects.append(select)
+                media_params += params
+            else:
+                stream_selects.append(select)
+                stream_params += params
+        selects = media_selects
+        if stream_selects:
+            selects.append(f'SELECT path FROM ({" INTERSECT ".join(stream_selects)})')
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT path, size, mtime, inode FROM probe WHERE kind = 'probe'
+                AND EXISTS (SELECT 1 FROM probe_values WHERE probe_values.path = probe.path)''')
+            identities = { row[0]: tuple(row[1:]) for row in rows }
+            # Partially probed media are only indexed for queries on their complete keys
+            partial = {}
+            for path, stream, key in self.conn.execute('SELECT path, stream, key FROM probe_keys'):
+                partial.setdefault(path, set()).add((stream < 0, key))
+            for path, keys in partial.items():
+                if not all(self.complete_key(query, keys) for query in queries):
+                    identities.pop(path, None)
+            matches = set()
+            if selects:
+                rows = self.conn.execute(' INTERSECT '.join(selects), media_params + stream_params)
+                matches = set(row[0] for row in rows)
+        return identities, matches
+
+# Cache used by all media objects, if enabled
+probe_cache = None
+
+def get_probe_cache():
+    return probe_cache
+
+def set_probe_cache(cache):
+    global probe_cache
+    probe_cache = cache
+
+# Stream information and detection options fingerprinting language detections,
+# limited to information available without a complete probe, e.g. from native Matroska parsing
+LANGUAGE_PARAMS = ('codec_type', 'codec_name', 'channels')
+LANGUAGE_OPTIONS = {
+    'audio': ('only_macrolanguages', 'max_audio_samples', 'min_score', 'whisper_model',
+        'adaptive_sampling', 'adaptive_confidence', 'adaptive_min_samples', 'vad'),
+    'subtitle': (),
+}
+
+class LanguageCache(Database):
+    """
+    Persistent cache of detected stream languages and scores stored as SQLite database.
+    Entries are keyed by path, stream index and detection options, and invalidated
+    if the identity of the file or the codec parameters of the stream change.
+    """
+    def __init__(self, refresh=False):
+        super().__init__("language")
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.cache, 'language.sqlite'),
+            check_same_thread=False)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS language (
+                    path TEXT NOT NULL,
+                    stream INTEGER NOT NULL,
+                    options TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    params TEXT NOT NULL,
+                    language TEXT,
+                    scores TEXT,
+                    PRIMARY KEY (path, stream, options))''')
+            self.conn.commit()
+
+    @staticmethod
+    def fingerprint(stream, opts):
+        info = stream.get_info()
+        # Avoid completing partial information, as file identities already cover most changes
+        params = { k: dict.get(info, k) for k in LANGUAGE_PARAMS }
+        options = { k: opts.get(k) for k in LANGUAGE_OPTIONS.get(info['codec_type'], ()) }
+        return json.dumps(params, sort_keys=True), json.dumps(options, sort_keys=True)
+
+    def get(self, stream, opts):
+        if self.refresh:
+            return None
+        path = os.path.abspath(stream.media.path)
+        try:
+            identity = file_identity(path)
+        except OSError:
+            return None
+        params, options = self.fingerprint(stream, opts)
+        with self.lock:
+            row = self.conn.execute('''
+                SELECT size, mtime, inode, params, language, scores FROM language
+                WHERE path=? AND stream=? AND options=?''', (path, stream.index, options)).fetchone()
+        if row is None or tuple(row[:3]) != identity or row[3] != params:
+            return None
+        return { 'language': row[4], 'scores': json.loads(row[5]) }
+
+    def put(self, stream, opts, language, scores=None):
+        path = os.path.abspath(stream.media.path)
+        try:
+            identity = file_identity(path)
+        except OSError:
+            return
+        params, options = self.fingerprint(stream, opts)
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO language VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, stream.index, options, *identity, params, language, json.dumps(scores)))
+            self.conn.commit()
+
+# Cache used for language detections, if enabled
+language_cache = None
+
+def get_language_cache():
+    return language_cache
+
+def set_language_cache(cache):
+    global language_cache
+    language_cache = cache
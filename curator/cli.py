@@ -15,24 +15,61 @@ def curator_argparser():
     parser = argparse.ArgumentParser()
     parser.add_argument('input', nargs='+', type=str)
     parser.add_argument('--log', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], default='WARNING')
-    parser.add_argument('-q', '--query', action='append', help="metadata filter(s), e.g. `tags.language=eng`", default=[])
+    parser.add_argument('-q', '--query', action='append', default=[],
+        help="metadata filter(s), e.g. `tags.language=eng`, `width>=1920`, `codec_name in hevc,h264`, " +
+             "`tags.title~=(?i)commentary`, `!tags.language` or `format.format_name=avi`")
     parser.add_argument('-y', action='store_true') # Auto-yes
     parser.add_argument('-n', action='store_true') # Auto-no
     parser.add_argument('-r', action='store_true') # Recursive
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='number of parallel jobs scanning and analyzing media (default: number of CPUs)')
+    parser.add_argument('--apply-jobs', type=int, default=1,
+        help='number of plan tasks applied concurrently (default: 1)')
+    parser.add_argument('--device-jobs', type=int, default=None,
+        help='max number of tasks applied concurrently per storage device (default: unlimited)')
+    parser.add_argument('--no-probe-cache', action='store_true',
+        help='do not read or store media metadata in the persistent probe cache')
+    parser.add_argument('--refresh-probe-cache', action='store_true',
+        help='ignore cached media metadata, probing all files again and updating the cache')
+    parser.add_argument('--resume', action='store_true',
+        help='resume interrupted plans, cleaning up partial outputs and skipping completed tasks')
     return parser
 
 def curator_args(parser, argv):
     args = parser.parse_args(argv)
+    # Non-positive limits would disable concurrency limits or never admit any task
+    for name in ('jobs', 'apply_jobs', 'device_jobs'):
+        if (value := getattr(args, name)) is not None and value < 1:
+            parser.error(f"argument --{name.replace('_', '-')}: must be a positive integer, got {value}")
     logging.basicConfig(format='%(asctime)s | %(levelname)s | %(message)s',
         level=getattr(logging, args.log), stream=sys.stderr)
+    if not args.no_probe_cache:
+        curator.set_probe_cache(curator.ProbeCache(refresh=args.refresh_probe_cache))
+    # Dry runs only read the journal to skip completed tasks, if resuming
+    if not args.n or args.resume:
+        curator.set_journal(curator.Journal())
+    if args.resume and not args.n and (recovered := curator.get_journal().recover()):
+        logging.info(f'Recovered {recovered} tasks interrupted in previous runs')
     return args
 
-def curator_input(args):
-    media = curator.media_input(args.input, recursive=args.r, queries=args.query)
+def curator_input(args, probe=False, stream=True):
+    # Plans iterating over the input only once can consume media as it is scanned
+    if stream:
+        return curator.media_iter(args.input, recursive=args.r, queries=args.query,
+            jobs=args.jobs, probe=probe)
+    media = curator.media_input(args.input, recursive=args.r, queries=args.query,
+        jobs=args.jobs, probe=probe)
     logging.info(f'Analyzing {len(media)} input media files')
     return media
 
 def curator_handle_plan(plan, args):
+    # Skip tasks completed in previous runs
+    if args.resume and (journal := curator.get_journal()):
+        plan.optimize()
+        tasks = [task for task in plan if not journal.is_completed(task)]
+        if len(tasks) < len(plan):
+            logging.info(f'Skipping {len(plan) - len(tasks)} tasks completed in previous runs')
+            plan.tasks = tasks
     plan.validate()
     if plan.is_empty():
         print('Current plan requires no tasks. There is nothing to be done.')
@@ -44,18 +81,18 @@ def curator_handle_plan(plan, args):
         return
     # Blind run
     if args.y:
-        curator_apply_plan(plan)
+        curator_apply_plan(plan, args.apply_jobs, args.device_jobs)
         return
     # Interactive mode (default)
     plan.edit()
     tasks_enabled = len([t for t in plan if t.enabled])
     print(f"After changes, the current plan has {tasks_enabled} tasks enabled out of {len(plan)}.")
     if confirm("Apply plan?", default="no"):
-        curator_apply_plan(plan)
+        curator_apply_plan(plan, args.apply_jobs, args.device_jobs)
 
-def curator_apply_plan(plan):
+def curator_apply_plan(plan, jobs=1, device_jobs=None):
     plan.optimize()
-    plan.apply()
+    plan.apply(jobs, device_jobs)
     tasks_failed = len([t for t in plan if t.failed])
     if not tasks_failed:
         print('All tasks completed successfully')
@@ -71,6 +108,7 @@ Usage: curator <command> [<args>]
 
 The following commands are supported:
   convert  Convert files to a different format.
+  fuse     Convert, merge and tag files writing each output once.
   link     Create symbolic links to files in another directory.
   merge    Merge related files into a single container.
   rename   Rename files according to their metadata.
@@ -84,10 +122,29 @@ def curator_convert(argv):
     args = curator_args(parser, argv)
 
     from curator.plans import plan_convert
-    media = curator_input(args)
+    media = curator_input(args, probe=True)
     plan = plan_convert(media, args.format, args.delete)
     curator_handle_plan(plan, args)
 
+def curator_fuse(argv):
+    parser = curator_argparser()
+    parser.add_argument('-d', '--delete', action='store_true', help='delete inputs after processing')
+    parser.add_argument('-f', '--format', choices=['mkv'], default='mkv')
+    parser.add_argument('-s', '--streams', default="all", choices=["all", "audio", "subtitle"])
+    parser.add_argument('-t', '--tag', required=False, choices=["language"])
+    parser.add_argument('-v', '--value', required=False)
+    parser.add_argument('--skip-tagged', action='store_true',
+        help='skip streams if a valid tag already exists')
+    curator_tag_argparser(parser)
+    args = curator_args(parser, argv)
+    opts = curator_tag_opts(args)
+
+    from curator.plans import plan_fuse
+    media = curator_input(args, probe=True, stream=False)
+    plan = plan_fuse(media, args.format, args.delete, args.streams, args.tag, args.value,
+        args.skip_tagged, opts, **curator_detect_jobs(args))
+    curator_handle_plan(plan, args)
+
 def curator_link(argv):
     parser = curator_argparser()
     parser.add_argument('-o', '--output', required=True)
@@ -133,7 +190,7 @@ def curator_merge(argv):
         opts[k] = opts[k].split(',')
 
     from curator.plans import plan_merge
-    media = curator_input(args)
+    media = curator_input(args, probe=True, stream=False)
     plan = plan_merge(media, args.format, args.delete, opts)
     curator_handle_plan(plan, args)
 
@@ -151,13 +208,10 @@ def curator_rename(argv):
     plan = plan_rename(media, args.format, db)
     curator_handle_plan(plan, args)
 
-def curator_tag(argv):
-    parser = curator_argparser()
-    parser.add_argument('-s', '--streams', default="all", choices=["all", "audio", "subtitle"])
-    parser.add_argument('-t', '--tag', required=True, choices=["language"])
-    parser.add_argument('-v', '--value', required=False)
-    parser.add_argument('--skip-tagged', action='store_true',
-        help='skip streams if a valid tag already exists')
+# Default max number of concurrent language detection jobs
+DETECT_MAX_JOBS = 4
+
+def curator_tag_argparser(parser):
     # Tag-specific options
     parser.add_argument('--only-macrolanguages', action='store_true',
         help='when detecting languages, consider only macrolanguages. ' +
@@ -166,21 +220,67 @@ def curator_tag(argv):
         help='when detecting languages in audio, max number of samples to extract.')
     parser.add_argument('--min-score', type=float, default=0.8,
         help='when detecting languages in audio, max number of samples to extract.')
-    args = curator_args(parser, argv)
+    parser.add_argument('--whisper-model', default='base', choices=['tiny', 'base', 'small', 'medium', 'large'],
+        help='when detecting languages in audio, Whisper model to use (default: base).')
+    parser.add_argument('--whisper-threads', type=int, default=None,
+        help='when detecting languages in audio, number of PyTorch CPU threads.')
+    parser.add_argument('--whisper-batch-size', type=int, default=16,
+        help='when detecting languages in audio, max number of samples per Whisper inference.')
+    parser.add_argument('--audio-jobs', type=int, default=None,
+        help=f'when detecting languages, number of threads extracting audio samples (default: --jobs, up to {DETECT_MAX_JOBS}).')
+    parser.add_argument('--subtitle-jobs', type=int, default=None,
+        help=f'when detecting languages, number of processes detecting subtitle languages (default: --jobs, up to {DETECT_MAX_JOBS}).')
+    parser.add_argument('--no-language-cache', action='store_true',
+        help='do not reuse or store language detections in the cache.')
+    parser.add_argument('--refresh-language-cache', action='store_true',
+        help='detect languages again, replacing any cached results.')
+    parser.add_argument('--vad', action='store_true',
+        help='when detecting languages in audio, sample windows with speech found by an energy-based VAD.')
+    parser.add_argument('--adaptive-sampling', action='store_true',
+        help='when detecting languages in audio, stop sampling once the detected language is settled.')
+    parser.add_argument('--adaptive-confidence', type=float, default=0.95,
+        help='when sampling adaptively, min average probability to stop early (default: 0.95).')
 
+def curator_tag_opts(args):
     # Select relevant options
     select = lambda *keys: { k: vars(args)[k] for k in keys }
+    opts = {}
     if args.tag == 'language':
-        opts = select('only_macrolanguages', 'max_audio_samples', 'min_score')
+        opts = select('only_macrolanguages', 'max_audio_samples', 'min_score',
+            'whisper_model', 'whisper_threads', 'whisper_batch_size',
+            'adaptive_sampling', 'adaptive_confidence', 'vad')
+        if not args.no_language_cache:
+            curator.set_language_cache(curator.LanguageCache(refresh=args.refresh_language_cache))
+    return opts
+
+def curator_detect_jobs(args):
+    # Each job holds audio samples or a spawned interpreter, so defaults are bounded
+    return {
+        'audio_jobs': args.audio_jobs or min(DETECT_MAX_JOBS, args.jobs),
+        'subtitle_jobs': args.subtitle_jobs or min(DETECT_MAX_JOBS, args.jobs),
+    }
+
+def curator_tag(argv):
+    parser = curator_argparser()
+    parser.add_argument('-s', '--streams', default="all", choices=["all", "audio", "subtitle"])
+    parser.add_argument('-t', '--tag', required=True, choices=["language"])
+    parser.add_argument('-v', '--value', required=False)
+    parser.add_argument('--skip-tagged', action='store_true',
+        help='skip streams if a valid tag already exists')
+    curator_tag_argparser(parser)
+    args = curator_args(parser, argv)
+    opts = curator_tag_opts(args)
 
     from curator.plans import plan_tag
-    media = curator_input(args)
-    plan = plan_tag(media, args.streams, args.tag, args.value, args.skip_tagged, opts)
+    media = curator_input(args, probe=True)
+    plan = plan_tag(media, args.streams, args.tag, args.value, args.skip_tagged, opts,
+        **curator_detect_jobs(args))
     curator_handle_plan(plan, args)
 
 def main():
     commands = {
         'convert': curator_convert,
+        'fuse': curator_fuse,
         'link': curator_link,
         'merge': curator_merge,
         'rename': curator_rename,
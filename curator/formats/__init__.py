@@ -0,0 +1 @@
+# Native parsers for container formats, used to avoid spawning ffmpeg processes
@@ -0,0 +1,135 @@
+import os
+import struct
+
+def iter_chunks(f, start, end):
+    """
+    Yield (fourcc, data offset, data size) of the RIFF chunks within range [start, end).
+    """
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        fourcc, size = struct.unpack('<4sI', header)
+        yield fourcc, offset + 8, size
+        offset += 8 + size + (size & 1)
+
+def find_list(f, start, end, form):
+    """
+    Find the RIFF list with the given form type, returning its data range (after the form type).
+    """
+    for fourcc, offset, size in iter_chunks(f, start, end):
+        if fourcc != b'LIST' or size < 4:
+            continue
+        f.seek(offset)
+        if f.read(4) == form:
+            return offset + 4, min(offset + size, end)
+    return None
+
+def read_riff_header(f):
+    """
+    Check the RIFF AVI header, returning the data range of the top-level chunks.
+    """
+    end = os.fstat(f.fileno()).st_size
+    f.seek(0)
+    riff, size, form = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or form != b'AVI ':
+        raise Exception("File is not a RIFF AVI")
+    return 12, min(8 + size, end)
+
+def read_stream_chunk(path, index, max_size=0x100000):
+    """
+    Read the first non-empty data chunk of an AVI stream (e.g. `00dc` for the first
+    video packet of stream #0), walking the `movi` list without demuxing the file.
+    Returns None if no such chunk exists.
+    """
+    fourccs = (f'{index:02d}dc'.encode(), f'{index:02d}db'.encode(), f'{index:02d}wb'.encode())
+    with open(path, 'rb') as f:
+        start, end = read_riff_header(f)
+        movi = find_list(f, start, end, b'movi')
+        if movi is None:
+            return None
+        # Empty `movi` sizes appear in truncated captures, scan until end of file instead
+        movi_start, movi_end = movi
+        if movi_end <= movi_start:
+            movi_end = end
+        ranges = [(movi_start, movi_end)]
+        while ranges:
+            range_start, range_end = ranges.pop()
+            for fourcc, offset, size in iter_chunks(f, range_start, range_end):
+                # Descend into `rec ` lists grouping interleaved chunks
+                if fourcc == b'LIST':
+                    ranges.append((offset + size + (size & 1), range_end))
+                    ranges.append((offset + 4, offset + size))
+                    break
+                if fourcc in fourccs and size > 0:
+                    f.seek(offset)
+                    return f.read(min(size, max_size))
+    return None
+
+def info_chunk(fourcc, data):
+    """
+    Serialize a RIFF chunk, padded to an even size.
+    """
+    pad = b'\x00' if len(data) & 1 else b''
+    return struct.pack('<4sI', fourcc, len(data)) + data + pad
+
+def write_info_tags(path, tags, dry_run=False):
+    """
+    Update RIFF INFO tags (e.g. `IAS1` for the language of the first audio stream) in place.
+    Values are rewritten within their current chunks when they fit, otherwise the INFO list
+    grows into an adjacent JUNK chunk, or is created inside one. Returns False if no room exists,
+    leaving the file untouched. Dry runs only check whether there is room.
+    """
+    tags = { k.encode() if isinstance(k, str) else k: v.encode('utf-8') + b'\x00' for k, v in tags.items() }
+    with open(path, 'rb' if dry_run else 'r+b') as f:
+        start, end = read_riff_header(f)
+        chunks = []
+        for fourcc, offset, size in iter_chunks(f, start, end):
+            form = None
+            if fourcc == b'LIST':
+                f.seek(offset)
+                form = f.read(4)
+                if form == b'movi':
+                    break
+            chunks.append((fourcc, form, offset - 8, 8 + size + (size & 1)))
+
+        # Build the updated INFO list
+        index = next((i for i, c in enumerate(chunks) if c[1] == b'INFO'), None)
+        entries = []
+        if index is not None:
+            _, _, info_offset, info_total = chunks[index]
+            for fourcc, offset, size in iter_chunks(f, info_offset + 12, info_offset + info_total):
+                f.seek(offset)
+                entries.append([fourcc, f.read(size)])
+        for fourcc, data in tags.items():
+            entry = next((e for e in entries if e[0] == fourcc), None)
+            if entry is None:
+                entries.append([fourcc, data])
+            elif len(data) <= len(entry[1]):
+                entry[1] = data.ljust(len(entry[1]), b'\x00')
+            else:
+                entry[1] = data
+        info = info_chunk(b'LIST', b'INFO' + b''.join(info_chunk(*e) for e in entries))
+
+        # Find room for it, either the current list and the JUNK chunk after it, or any JUNK chunk
+        if index is not None:
+            candidates = [(info_offset, info_total)]
+            if index + 1 < len(chunks) and chunks[index + 1][0] == b'JUNK':
+                candidates.append((info_offset, info_total + chunks[index + 1][3]))
+        else:
+            candidates = [(c[2], c[3]) for c in chunks if c[0] == b'JUNK']
+        for offset, total in candidates:
+            if len(info) == total:
+                data = info
+            elif len(info) + 8 <= total:
+                data = info + struct.pack('<4sI', b'JUNK', total - len(info) - 8)
+            else:
+                continue
+            if dry_run:
+                return True
+            f.seek(offset)
+            f.write(data)
+            return True
+    return False
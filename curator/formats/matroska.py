@@ -0,0 +1,658 @@
+import os
+import struct
+import zlib
+
+import iso639
+
+# Element IDs
+EBML_ID_HEADER = 0x1A45DFA3
+EBML_ID_DOCTYPE = 0x4282
+EBML_ID_VOID = 0xEC
+EBML_ID_CRC32 = 0xBF
+MKV_ID_SEGMENT = 0x18538067
+MKV_ID_SEEKHEAD = 0x114D9B74
+MKV_ID_SEEK = 0x4DBB
+MKV_ID_SEEKID = 0x53AB
+MKV_ID_SEEKPOSITION = 0x53AC
+MKV_ID_INFO = 0x1549A966
+MKV_ID_TIMECODESCALE = 0x2AD7B1
+MKV_ID_DURATION = 0x4489
+MKV_ID_TITLE = 0x7BA9
+MKV_ID_TRACKS = 0x1654AE6B
+MKV_ID_TRACKENTRY = 0xAE
+MKV_ID_TRACKNUMBER = 0xD7
+MKV_ID_TRACKUID = 0x73C5
+MKV_ID_TRACKTYPE = 0x83
+MKV_ID_FLAGDEFAULT = 0x88
+MKV_ID_FLAGFORCED = 0x55AA
+MKV_ID_FLAGHEARINGIMPAIRED = 0x55AB
+MKV_ID_FLAGVISUALIMPAIRED = 0x55AC
+MKV_ID_FLAGORIGINAL = 0x55AE
+MKV_ID_FLAGCOMMENTARY = 0x55AF
+MKV_ID_NAME = 0x536E
+MKV_ID_LANGUAGE = 0x22B59C
+MKV_ID_LANGUAGEIETF = 0x22B59D
+MKV_ID_CODECID = 0x86
+MKV_ID_VIDEO = 0xE0
+MKV_ID_PIXELWIDTH = 0xB0
+MKV_ID_PIXELHEIGHT = 0xBA
+MKV_ID_AUDIO = 0xE1
+MKV_ID_CHANNELS = 0x9F
+MKV_ID_TAGS = 0x1254C367
+MKV_ID_TAG = 0x7373
+MKV_ID_TARGETS = 0x63C0
+MKV_ID_TAGTRACKUID = 0x63C5
+MKV_ID_SIMPLETAG = 0x67C8
+MKV_ID_TAGNAME = 0x45A3
+MKV_ID_TAGSTRING = 0x4487
+MKV_ID_TAGLANGUAGE = 0x447A
+MKV_ID_TAGDEFAULT = 0x4484
+MKV_ID_TAGDEFAULT_BUG = 0x44B4
+MKV_ID_ATTACHMENTS = 0x1941A469
+MKV_ID_ATTACHEDFILE = 0x61A7
+MKV_ID_FILENAME = 0x466E
+MKV_ID_FILEMIMETYPE = 0x4660
+MKV_ID_CLUSTER = 0x1F43B675
+
+# Track types
+MKV_TRACK_TYPES = {
+    1: 'video',
+    2: 'audio',
+    17: 'subtitle',
+}
+
+# Codec IDs prefixes mapped into FFmpeg codec names, matched in order
+MKV_CODECS = [
+    ('V_MPEG4/ISO/AVC', 'h264'),
+    ('V_MPEGH/ISO/HEVC', 'hevc'),
+    ('V_MPEG4/ISO/', 'mpeg4'),
+    ('V_MPEG4/MS/V3', 'msmpeg4v3'),
+    ('V_MPEG1', 'mpeg1video'),
+    ('V_MPEG2', 'mpeg2video'),
+    ('V_VP8', 'vp8'),
+    ('V_VP9', 'vp9'),
+    ('V_AV1', 'av1'),
+    ('V_THEORA', 'theora'),
+    ('V_PRORES', 'prores'),
+    ('V_MJPEG', 'mjpeg'),
+    ('V_FFV1', 'ffv1'),
+    ('A_AAC', 'aac'),
+    ('A_AC3', 'ac3'),
+    ('A_EAC3', 'eac3'),
+    ('A_DTS', 'dts'),
+    ('A_TRUEHD', 'truehd'),
+    ('A_MLP', 'mlp'),
+    ('A_FLAC', 'flac'),
+    ('A_OPUS', 'opus'),
+    ('A_VORBIS', 'vorbis'),
+    ('A_ALAC', 'alac'),
+    ('A_MPEG/L3', 'mp3'),
+    ('A_MPEG/L2', 'mp2'),
+    ('A_MPEG/L1', 'mp1'),
+    ('S_TEXT/UTF8', 'subrip'),
+    ('S_TEXT/ASCII', 'text'),
+    ('S_TEXT/SSA', 'ass'),
+    ('S_TEXT/ASS', 'ass'),
+    ('S_SSA', 'ass'),
+    ('S_ASS', 'ass'),
+    ('S_TEXT/WEBVTT', 'webvtt'),
+    ('S_HDMV/PGS', 'hdmv_pgs_subtitle'),
+    ('S_HDMV/TEXTST', 'hdmv_text_subtitle'),
+    ('S_VOBSUB', 'dvd_subtitle'),
+    ('S_DVBSUB', 'dvb_subtitle'),
+]
+
+# Subtitle codecs without dimensions
+MKV_TEXT_SUBTITLES = ('subrip', 'text', 'ass', 'webvtt')
+
+# Attachment MIME types mapped into FFmpeg codec names
+MKV_ATTACHMENTS = {
+    'application/x-truetype-font': 'ttf',
+    'application/x-font': 'ttf',
+    'application/font-sfnt': 'ttf',
+    'font/ttf': 'ttf',
+    'font/sfnt': 'ttf',
+    'application/vnd.ms-opentype': 'otf',
+    'font/otf': 'otf',
+    'text/plain': 'text',
+    'binary': 'bin_data',
+}
+
+def read_vint(f):
+    """
+    Read an EBML variable-length integer, returning its raw bytes.
+    """
+    data = f.read(1)
+    if not data:
+        raise EOFError("Unexpected end of EBML data")
+    length = 1
+    while length <= 8 and not data[0] & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise Exception("Invalid EBML variable-length integer")
+    data += f.read(length - 1)
+    if len(data) != length:
+        raise EOFError("Unexpected end of EBML data")
+    return data
+
+def read_element_header(f):
+    """
+    Read an EBML element header, returning its ID, size (None if unknown) and header size.
+    """
+    eid = read_vint(f)
+    raw = read_vint(f)
+    mask = (1 << (7 * len(raw))) - 1
+    size = int.from_bytes(raw, 'big') & mask
+    if size == mask:
+        size = None
+    return int.from_bytes(eid, 'big'), size, len(eid) + len(raw)
+
+def iter_elements(f, start, end):
+    """
+    Yield (ID, header offset, data offset, data size) of EBML elements within range [start, end).
+    Elements of unknown size are assumed to extend until the end of the range.
+    """
+    offset = start
+    while offset < end:
+        f.seek(offset)
+        try:
+            eid, size, header_size = read_element_header(f)
+        except EOFError:
+            return
+        if size is None:
+            size = end - offset - header_size
+        yield eid, offset, offset + header_size, size
+        offset += header_size + size
+
+def read_uint(f, offset, size):
+    f.seek(offset)
+    return int.from_bytes(f.read(size), 'big')
+
+def read_float(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if size == 4:
+        return struct.unpack('>f', data)[0]
+    if size == 8:
+        return struct.unpack('>d', data)[0]
+    return 0.0
+
+def read_string(f, offset, size):
+    f.seek(offset)
+    return f.read(size).split(b'\x00')[0].decode('utf-8', errors='replace')
+
+def read_segment(f):
+    """
+    Locate the top-level elements of the first Matroska segment.
+    Returns the segment data offset and a dictionary of element IDs to lists of
+    (header offset, data offset, data size), using SeekHead entries to reach
+    elements stored after clusters.
+    """
+    end = os.fstat(f.fileno()).st_size
+    elements = iter_elements(f, 0, end)
+    eid, _, offset, size = next(elements)
+    if eid != EBML_ID_HEADER:
+        raise Exception("File is not an EBML document")
+    doctype = None
+    for cid, _, coffset, csize in iter_elements(f, offset, offset + size):
+        if cid == EBML_ID_DOCTYPE:
+            doctype = read_string(f, coffset, csize)
+    if doctype not in ('matroska', 'webm'):
+        raise Exception(f"Unsupported EBML document type: {doctype}")
+    for eid, _, offset, size in elements:
+        if eid == MKV_ID_SEGMENT:
+            break
+    else:
+        raise Exception("File has no Matroska segment")
+    segment_start = offset
+    segment_end = min(offset + size, end)
+
+    # Scan top-level elements until the first cluster
+    found = {}
+    for eid, hoffset, offset, size in iter_elements(f, segment_start, segment_end):
+        if eid == MKV_ID_CLUSTER:
+            break
+        found.setdefault(eid, []).append((hoffset, offset, size))
+
+    # Follow SeekHead entries, including chained SeekHeads
+    seekheads = list(found.get(MKV_ID_SEEKHEAD, []))
+    visited = set(map(lambda e: e[0], seekheads))
+    while seekheads:
+        _, offset, size = seekheads.pop()
+        for eid, _, soffset, ssize in iter_elements(f, offset, offset + size):
+            if eid != MKV_ID_SEEK:
+                continue
+            seek_id, seek_pos = None, None
+            for cid, _, coffset, csize in iter_elements(f, soffset, soffset + ssize):
+                if cid == MKV_ID_SEEKID:
+                    seek_id = read_uint(f, coffset, csize)
+                if cid == MKV_ID_SEEKPOSITION:
+                    seek_pos = read_uint(f, coffset, csize)
+            if seek_id is None or seek_pos is None:
+                continue
+            hoffset = segment_start + seek_pos
+            if hoffset in visited or hoffset >= segment_end:
+                continue
+            visited.add(hoffset)
+            f.seek(hoffset)
+            eid, size, header_size = read_element_header(f)
+            if eid != seek_id or size is None:
+                continue
+            entry = (hoffset, hoffset + header_size, size)
+            if eid == MKV_ID_SEEKHEAD:
+                seekheads.append(entry)
+            if entry not in found.setdefault(eid, []):
+                found[eid].append(entry)
+    return segment_start, found
+
+def read_tracks(f, offset, size):
+    tracks = []
+    for eid, _, toffset, tsize in iter_elements(f, offset, offset + size):
+        if eid != MKV_ID_TRACKENTRY:
+            continue
+        track = {
+            'offset': toffset,
+            'size': tsize,
+            'language': 'eng',
+            'default': 1,
+            'forced': 0,
+            'hearing_impaired': 0,
+            'visual_impaired': 0,
+            'original': 0,
+            'comment': 0,
+            'channels': 1,
+        }
+        for cid, _, coffset, csize in iter_elements(f, toffset, toffset + tsize):
+            if cid == MKV_ID_TRACKNUMBER:
+                track['number'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_TRACKUID:
+                track['uid'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_TRACKTYPE:
+                track['type'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_CODECID:
+                track['codec_id'] = read_string(f, coffset, csize)
+            elif cid == MKV_ID_NAME:
+                track['name'] = read_string(f, coffset, csize)
+            elif cid == MKV_ID_LANGUAGE:
+                track['language'] = read_string(f, coffset, csize)
+            elif cid == MKV_ID_FLAGDEFAULT:
+                track['default'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_FLAGFORCED:
+                track['forced'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_FLAGHEARINGIMPAIRED:
+                track['hearing_impaired'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_FLAGVISUALIMPAIRED:
+                track['visual_impaired'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_FLAGORIGINAL:
+                track['original'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_FLAGCOMMENTARY:
+                track['comment'] = read_uint(f, coffset, csize)
+            elif cid == MKV_ID_VIDEO:
+                for vid, _, voffset, vsize in iter_elements(f, coffset, coffset + csize):
+                    if vid == MKV_ID_PIXELWIDTH:
+                        track['width'] = read_uint(f, voffset, vsize)
+                    if vid == MKV_ID_PIXELHEIGHT:
+                        track['height'] = read_uint(f, voffset, vsize)
+            elif cid == MKV_ID_AUDIO:
+                for aid, _, aoffset, asize in iter_elements(f, coffset, coffset + csize):
+                    if aid == MKV_ID_CHANNELS:
+                        track['channels'] = read_uint(f, aoffset, asize)
+        tracks.append(track)
+    return tracks
+
+def read_simple_tags(f, offset, size, tags, prefix=''):
+    """
+    Read a simple tag and its children, naming them as FFmpeg does: tags with a language other
+    than "und" get it as suffix, e.g. "BPS-eng", and are also stored unsuffixed if marked as default.
+    """
+    name, value, language, default, children = None, None, 'und', 0, []
+    for eid, _, coffset, csize in iter_elements(f, offset, offset + size):
+        if eid == MKV_ID_TAGNAME:
+            name = read_string(f, coffset, csize)
+        elif eid == MKV_ID_TAGSTRING:
+            value = read_string(f, coffset, csize)
+        elif eid == MKV_ID_TAGLANGUAGE:
+            language = read_string(f, coffset, csize)
+        elif eid in (MKV_ID_TAGDEFAULT, MKV_ID_TAGDEFAULT_BUG):
+            default = read_uint(f, coffset, csize)
+        elif eid == MKV_ID_SIMPLETAG:
+            children.append((coffset, csize))
+    if name is None:
+        return
+    keys = []
+    if default or language in ('', 'und'):
+        keys.append(prefix + name)
+    if language not in ('', 'und'):
+        keys.append(f'{prefix}{name}-{language}')
+    for key in keys:
+        if value is not None:
+            tags[key] = value
+        for coffset, csize in children:
+            read_simple_tags(f, coffset, csize, tags, f'{key}/')
+
+def read_tags(f, offset, size):
+    """
+    Read tags, returning a dictionary of track UIDs (0 for global tags) to dictionaries of tags.
+    """
+    targets = {}
+    for eid, _, toffset, tsize in iter_elements(f, offset, offset + size):
+        if eid != MKV_ID_TAG:
+            continue
+        uids = []
+        simple_tags = []
+        for cid, _, coffset, csize in iter_elements(f, toffset, toffset + tsize):
+            if cid == MKV_ID_TARGETS:
+                for tid, _, uoffset, usize in iter_elements(f, coffset, coffset + csize):
+                    if tid == MKV_ID_TAGTRACKUID:
+                        uids.append(read_uint(f, uoffset, usize))
+            elif cid == MKV_ID_SIMPLETAG:
+                simple_tags.append((coffset, csize))
+        for uid in uids or [0]:
+            tags = targets.setdefault(uid, {})
+            for coffset, csize in simple_tags:
+                read_simple_tags(f, coffset, csize, tags)
+    return targets
+
+def read_attachments(f, offset, size):
+    attachments = []
+    for eid, _, aoffset, asize in iter_elements(f, offset, offset + size):
+        if eid != MKV_ID_ATTACHEDFILE:
+            continue
+        attachment = {}
+        for cid, _, coffset, csize in iter_elements(f, aoffset, aoffset + asize):
+            if cid == MKV_ID_FILENAME:
+                attachment['filename'] = read_string(f, coffset, csize)
+            elif cid == MKV_ID_FILEMIMETYPE:
+                attachment['mimetype'] = read_string(f, coffset, csize)
+        attachments.append(attachment)
+    return attachments
+
+def codec_name(codec_id):
+    for prefix, name in MKV_CODECS:
+        if codec_id.startswith(prefix):
+            return name
+    return None
+
+def read_probe(path):
+    """
+    Read Matroska headers returning the subset of `ffprobe -show_format -show_streams`
+    output that can be reliably derived from them, i.e. format name and duration,
+    stream types, codecs, dimensions, channels, dispositions and tags.
+    Returns None if the file contains elements that FFmpeg might expose differently,
+    e.g. image attachments which are shown as video streams.
+    The keys of format and stream information that are complete, e.g. such that a missing
+    tag is missing in ffprobe output too, are listed under 'complete'.
+    """
+    with open(path, 'rb') as f:
+        _, elements = read_segment(f)
+        if MKV_ID_INFO not in elements or MKV_ID_TRACKS not in elements:
+            return None
+
+        # Segment information
+        timecode_scale = 1000000
+        duration = None
+        title = None
+        _, offset, size = elements[MKV_ID_INFO][0]
+        for eid, _, coffset, csize in iter_elements(f, offset, offset + size):
+            if eid == MKV_ID_TIMECODESCALE:
+                timecode_scale = read_uint(f, coffset, csize)
+            elif eid == MKV_ID_DURATION:
+                duration = read_float(f, coffset, csize)
+            elif eid == MKV_ID_TITLE:
+                title = read_string(f, coffset, csize)
+
+        # Tracks, tags and attachments
+        tracks = []
+        for _, offset, size in elements[MKV_ID_TRACKS]:
+            tracks += read_tracks(f, offset, size)
+        tags = {}
+        for _, offset, size in elements.get(MKV_ID_TAGS, []):
+            for uid, values in read_tags(f, offset, size).items():
+                tags.setdefault(uid, {}).update(values)
+        attachments = []
+        for _, offset, size in elements.get(MKV_ID_ATTACHMENTS, []):
+            attachments += read_attachments(f, offset, size)
+
+    # Build stream information
+    streams = []
+    for track in tracks:
+        codec_type = MKV_TRACK_TYPES.get(track.get('type'))
+        if codec_type is None or 'codec_id' not in track:
+            return None
+        stream_tags = dict(tags.get(track.get('uid'), {}))
+        if track['language'] != 'und':
+            stream_tags['language'] = track['language']
+        if 'name' in track:
+            stream_tags['title'] = track['name']
+        stream = {
+            'index': len(streams),
+            'codec_type': codec_type,
+            'disposition': { k: track[k] for k in ('default', 'forced', 'hearing_impaired',
+                'visual_impaired', 'original', 'comment') },
+            'tags': stream_tags,
+        }
+        if name := codec_name(track['codec_id']):
+            stream['codec_name'] = name
+        if codec_type == 'video':
+            for key in ('width', 'height'):
+                if key in track:
+                    stream[key] = track[key]
+        if codec_type == 'audio':
+            stream['channels'] = track['channels']
+        streams.append(stream)
+    for attachment in attachments:
+        name = MKV_ATTACHMENTS.get(attachment.get('mimetype'))
+        if name is None:
+            return None
+        streams.append({
+            'index': len(streams),
+            'codec_name': name,
+            'codec_type': 'attachment',
+            'tags': attachment,
+        })
+
+    # Build format information
+    format_tags = dict(tags.get(0, {}))
+    if title is not None:
+        format_tags['title'] = title
+    info = {
+        'filename': path,
+        'nb_streams': len(streams),
+        'format_name': 'matroska,webm',
+        'format_long_name': 'Matroska / WebM',
+        'size': str(os.path.getsize(path)),
+        'tags': format_tags,
+    }
+    if duration is not None:
+        info['duration'] = f'{duration * timecode_scale / 1e9:.6f}'
+
+    # Keys whose absence is reliable too, i.e. also absent in ffprobe output
+    format_keys = ['filename', 'nb_streams', 'format_name', 'format_long_name', 'size']
+    if duration is not None:
+        format_keys.append('duration')
+    stream_keys = ['index', 'codec_type', 'channels', 'tags']
+    stream_keys += [f'disposition.{k}' for k in ('default', 'forced', 'hearing_impaired',
+        'visual_impaired', 'original', 'comment')]
+    if all('codec_name' in stream for stream in streams):
+        stream_keys.append('codec_name')
+    # Dimensions of bitmap subtitles are only known to FFmpeg
+    if all(stream.get('codec_name') in MKV_TEXT_SUBTITLES for stream in streams
+           if stream['codec_type'] == 'subtitle'):
+        stream_keys += ['width', 'height']
+    complete = { 'format': format_keys, 'streams': stream_keys }
+    return { 'format': info, 'streams': streams, 'complete': complete }
+
+def encode_element(eid, data, size_length=None):
+    """
+    Serialize an EBML element, keeping the size length of an existing element if possible.
+    """
+    length = 1
+    while len(data) >= (1 << (7 * length)) - 1:
+        length += 1
+    if size_length is not None and size_length >= length:
+        length = size_length
+    if length > 8:
+        raise Exception("EBML element is too large")
+    size = ((1 << (7 * length)) | len(data)).to_bytes(length, 'big')
+    return eid.to_bytes((eid.bit_length() + 7) // 8, 'big') + size + data
+
+def encode_void(length):
+    """
+    Serialize an EbmlVoid element spanning exactly `length` bytes (at least 2).
+    """
+    if length < 128:
+        return encode_element(EBML_ID_VOID, bytes(length - 2), 1)
+    return encode_element(EBML_ID_VOID, bytes(length - 9), 8)
+
+def encode_master(f, eid, offset, size, size_length, children, extra=b''):
+    """
+    Serialize a master element from its children, given as the raw bytes of each child or None
+    to copy the original child from the file, followed by extra children.
+    Voids are dropped and CRC-32 elements recomputed.
+    """
+    data = b''
+    crc = False
+    for (cid, hoffset, coffset, csize), child in zip(iter_elements(f, offset, offset + size), children):
+        if cid == EBML_ID_CRC32:
+            crc = True
+        elif cid != EBML_ID_VOID:
+            if child is None:
+                f.seek(hoffset)
+                child = f.read(coffset + csize - hoffset)
+            data += child
+    data += extra
+    if crc:
+        data = encode_element(EBML_ID_CRC32, struct.pack('<I', zlib.crc32(data))) + data
+    return encode_element(eid, data, size_length)
+
+def update_crc(f, offset, size):
+    """
+    Recompute the CRC-32 element of a master element after modifying its data, if it has one.
+    """
+    elements = list(iter_elements(f, offset, offset + size))
+    if not elements or elements[0][0] != EBML_ID_CRC32 or elements[0][3] != 4:
+        return
+    _, _, coffset, csize = elements[0]
+    f.seek(coffset + csize)
+    data = f.read(offset + size - coffset - csize)
+    f.seek(coffset)
+    f.write(struct.pack('<I', zlib.crc32(data)))
+
+def bibliographic_language(language):
+    """
+    ISO 639-2/B code stored in Language elements, e.g. `ger` for `deu`, as written by mkvpropedit.
+    Codes without a bibliographic variant are kept as is.
+    """
+    try:
+        return iso639.Lang(pt3=language).pt2b or language
+    except iso639.exceptions.InvalidLanguageValue:
+        return language
+
+def encode_tracks(f, offset, size, size_length, languages):
+    """
+    Serialize the Tracks element with updated languages, indexed by track order,
+    converting them into ISO 639-2/B codes.
+    LanguageIETF elements of updated tracks are removed, as they take precedence over Language.
+    """
+    children = []
+    index = 0
+    for eid, _, toffset, tsize in iter_elements(f, offset, offset + size):
+        if eid != MKV_ID_TRACKENTRY or index not in languages:
+            index += eid == MKV_ID_TRACKENTRY
+            children.append(None)
+            continue
+        entry = []
+        language = encode_element(MKV_ID_LANGUAGE, bibliographic_language(languages[index]).encode('utf-8'))
+        for cid, _, _, _ in iter_elements(f, toffset, toffset + tsize):
+            if cid == MKV_ID_LANGUAGE and language:
+                entry.append(language)
+                language = None
+            elif cid in (MKV_ID_LANGUAGE, MKV_ID_LANGUAGEIETF):
+                entry.append(b'')
+            else:
+                entry.append(None)
+        children.append(encode_master(f, MKV_ID_TRACKENTRY, toffset, tsize, None, entry, language or b''))
+        index += 1
+    return encode_master(f, MKV_ID_TRACKS, offset, size, size_length, children)
+
+def write_track_languages(path, languages, dry_run=False):
+    """
+    Update the languages of tracks in place, indexed by track order, similarly to
+    `mkvpropedit --disable-language-ietf`. The Tracks element is rewritten over itself and
+    any EbmlVoid elements following it, otherwise it is moved to the end of the segment,
+    updating its SeekHead entry. Returns False if neither is possible, leaving the file untouched.
+    Dry runs only check whether either is possible.
+    """
+    with open(path, 'rb' if dry_run else 'r+b') as f:
+        end = os.fstat(f.fileno()).st_size
+        segment_start, elements = read_segment(f)
+        if len(elements.get(MKV_ID_TRACKS, [])) != 1:
+            return False
+        hoffset, offset, size = elements[MKV_ID_TRACKS][0]
+        tracks_count = sum(1 for eid, *_ in iter_elements(f, offset, offset + size) if eid == MKV_ID_TRACKENTRY)
+        if any(index >= tracks_count for index in languages):
+            return False
+        f.seek(hoffset)
+        read_vint(f)
+        tracks = encode_tracks(f, offset, size, len(read_vint(f)), languages)
+
+        # Rewrite tracks over their current position, reclaiming the following voids
+        region_end = offset + size
+        for eid, _, voffset, vsize in iter_elements(f, region_end, end):
+            if eid != EBML_ID_VOID:
+                break
+            region_end = voffset + vsize
+        room = region_end - hoffset
+        if len(tracks) == room or len(tracks) + 2 <= room:
+            if dry_run:
+                return True
+            f.seek(hoffset)
+            f.write(tracks)
+            if len(tracks) < room:
+                f.write(encode_void(room - len(tracks)))
+            return True
+
+        # Otherwise find the segment size and the SeekHead entry to update
+        for length in range(1, 9):
+            segment_offset = segment_start - length - 4
+            f.seek(segment_offset)
+            if f.read(4) == MKV_ID_SEGMENT.to_bytes(4, 'big') and len(raw := read_vint(f)) == length:
+                break
+        else:
+            return False
+        mask = (1 << (7 * len(raw))) - 1
+        segment_size = int.from_bytes(raw, 'big') & mask
+        if segment_size != mask:
+            if segment_start + segment_size != end or segment_size + len(tracks) >= mask:
+                return False
+        seek_position = None
+        for _, soffset, ssize in elements.get(MKV_ID_SEEKHEAD, []):
+            for eid, _, eoffset, esize in iter_elements(f, soffset, soffset + ssize):
+                if eid != MKV_ID_SEEK:
+                    continue
+                seek_id, position = None, None
+                for cid, _, coffset, csize in iter_elements(f, eoffset, eoffset + esize):
+                    if cid == MKV_ID_SEEKID:
+                        seek_id = read_uint(f, coffset, csize)
+                    if cid == MKV_ID_SEEKPOSITION:
+                        position = (coffset, csize)
+                if seek_id == MKV_ID_TRACKS and position:
+                    seek_position = (soffset, ssize) + position
+        if seek_position is None or end - segment_start >= 1 << (8 * seek_position[3]):
+            return False
+        if dry_run:
+            return True
+
+        # Append tracks before pointing to them and discarding the original element
+        f.seek(end)
+        f.write(tracks)
+        if segment_size != mask:
+            f.seek(segment_offset + 4)
+            f.write(((1 << (7 * len(raw))) | segment_size + len(tracks)).to_bytes(len(raw), 'big'))
+        soffset, ssize, coffset, csize = seek_position
+        f.seek(coffset)
+        f.write((end - segment_start).to_bytes(csize, 'big'))
+        update_crc(f, soffset, ssize)
+        f.seek(hoffset)
+        f.write(encode_void(room))
+    return True
@@ -0,0 +1,87 @@
+import os
+import struct
+
+# Boxes containing the track media headers
+MP4_CONTAINERS = (b'moov', b'trak', b'mdia')
+
+def iter_boxes(f, start, end):
+    """
+    Yield (type, box offset, data offset, box end) of the ISO BMFF boxes within range [start, end).
+    """
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        data = offset + 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            data += 8
+        elif size == 0:
+            size = end - offset
+        if size < data - offset:
+            return
+        yield kind, offset, data, min(offset + size, end)
+        offset += size
+
+def pack_language(language):
+    """
+    Pack an ISO 639-2/T code into the 15-bit representation of `mdhd` boxes.
+    Returns None if the code cannot be represented.
+    """
+    if len(language) != 3 or not all('a' <= c <= 'z' for c in language):
+        return None
+    return sum((ord(c) - 0x60) << shift for c, shift in zip(language, (10, 5, 0)))
+
+def read_tracks(f):
+    """
+    Find the media boxes of each track, in the order of `trak` boxes, i.e. stream indices.
+    """
+    end = os.fstat(f.fileno()).st_size
+    tracks = []
+    for kind, _, data, box_end in iter_boxes(f, 0, end):
+        if kind != b'moov':
+            continue
+        for kind, _, data, box_end in iter_boxes(f, data, box_end):
+            if kind != b'trak':
+                continue
+            track = {}
+            for kind, _, data, box_end in iter_boxes(f, data, box_end):
+                if kind != b'mdia':
+                    continue
+                for kind, offset, data, box_end in iter_boxes(f, data, box_end):
+                    track.setdefault(kind, (offset, data, box_end))
+            tracks.append(track)
+    return tracks
+
+def write_track_languages(path, languages, dry_run=False):
+    """
+    Update the languages of tracks in place, patching the fixed-size `mdhd` language field.
+    Extended language boxes (`elng`) would take precedence, so they are turned into `free` boxes.
+    Returns False if any update is not possible, leaving the file untouched.
+    Dry runs only check whether all updates are possible.
+    """
+    with open(path, 'rb' if dry_run else 'r+b') as f:
+        tracks = read_tracks(f)
+        patches = []
+        for index, language in languages.items():
+            packed = pack_language(language)
+            if packed is None or index >= len(tracks) or b'mdhd' not in tracks[index]:
+                return False
+            _, data, box_end = tracks[index][b'mdhd']
+            f.seek(data)
+            version = f.read(1)[0]
+            offset = data + (32 if version == 1 else 20)
+            if offset + 2 > box_end:
+                return False
+            patches.append((offset, struct.pack('>H', packed)))
+            if b'elng' in tracks[index]:
+                patches.append((tracks[index][b'elng'][0] + 4, b'free'))
+        if dry_run:
+            return True
+        for offset, data in patches:
+            f.seek(offset)
+            f.write(data)
+    return True
@@ -0,0 +1,147 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from .cache import file_identity
+from .database import Database
+from .util import TEMP_PREFIX, process_alive
+
+def path_identity(path):
+    try:
+        return list(file_identity(path))
+    except OSError:
+        return None
+
+# Completed tasks are forgotten after this many days
+JOURNAL_MAX_DAYS = 30
+
+def task_identities(task):
+    return { path: path_identity(path) for path in
+        [os.path.abspath(m.path) for m in task.inputs + task.outputs] }
+
+class Journal(Database):
+    """
+    Write-ahead journal of applied tasks stored as SQLite database.
+    Tasks are recorded before they start and after they complete, keyed by their type, paths
+    and description, along with the identities of their files, so interrupted plans can be resumed.
+    """
+    def __init__(self):
+        super().__init__("journal")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.cache, 'journal.sqlite'),
+            check_same_thread=False)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=FULL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    key TEXT NOT NULL PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    inputs TEXT NOT NULL,
+                    outputs TEXT NOT NULL,
+                    completed TEXT,
+                    time REAL NOT NULL)''')
+            self.conn.execute("DELETE FROM tasks WHERE state='done' AND time<?",
+                (time.time() - JOURNAL_MAX_DAYS * 86400,))
+            self.conn.commit()
+
+    @staticmethod
+    def task_key(task):
+        inputs = [os.path.abspath(m.path) for m in task.inputs]
+        outputs = [os.path.abspath(m.path) for m in task.outputs]
+        view = [list(map(str, row)) for row in task.view()]
+        data = json.dumps([type(task).__name__, inputs, outputs, view])
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def start(self, task):
+        key = self.task_key(task)
+        inputs = { os.path.abspath(m.path): path_identity(m.path) for m in task.inputs }
+        outputs = { os.path.abspath(m.path): path_identity(m.path) for m in task.outputs }
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, 'started', os.getpid(), json.dumps(inputs), json.dumps(outputs), None, time.time()))
+            self.conn.commit()
+        return key
+
+    def commit(self, task):
+        """
+        Record that the outputs of a started task are complete, right before they are moved into place.
+        """
+        with self.lock:
+            self.conn.execute("UPDATE tasks SET state='committed' WHERE key=? AND state='started'",
+                (self.task_key(task),))
+            self.conn.commit()
+
+    def finish(self, key, task):
+        # Tasks might modify their inputs, e.g. in-place merges, so all files are fingerprinted again
+        completed = task_identities(task)
+        with self.lock:
+            self.conn.execute('UPDATE tasks SET state=?, completed=?, time=? WHERE key=?',
+                ('done', json.dumps(completed), time.time(), key))
+            self.conn.commit()
+
+    def is_completed(self, task):
+        """
+        Whether the task was completed by a previous run and its files are unchanged since.
+        """
+        key = self.task_key(task)
+        with self.lock:
+            row = self.conn.execute('SELECT state, completed FROM tasks WHERE key=?', (key,)).fetchone()
+        if row is None or row[0] != 'done':
+            return False
+        completed = json.loads(row[1])
+        return all(path_identity(path) == identity for path, identity in completed.items())
+
+    def recover(self):
+        """
+        Clean up after tasks interrupted in previous runs that are no longer running, removing
+        their temporary directories and partially written outputs, as long as their inputs are intact.
+        Outputs of tasks interrupted after committing them are kept.
+        Returns the number of recovered tasks.
+        """
+        with self.lock:
+            rows = self.conn.execute('''SELECT key, state, pid, inputs, outputs FROM tasks
+                WHERE state IN ('started', 'committed')''').fetchall()
+        rows = [row for row in rows if not process_alive(row[2])]
+        for key, state, pid, inputs, outputs in rows:
+            inputs = json.loads(inputs)
+            outputs = json.loads(outputs)
+            temps = set()
+            for directory in set(os.path.dirname(path) for path in list(inputs) + list(outputs)):
+                temps.update(glob.glob(os.path.join(glob.escape(directory), f'{TEMP_PREFIX}{pid}-*')))
+            for tmp in sorted(temps):
+                logging.info(f'Removing temporary directory: {tmp}')
+                shutil.rmtree(tmp, ignore_errors=True)
+            intact = all(path_identity(path) == identity for path, identity in inputs.items())
+            for path, identity in outputs.items():
+                if path in inputs or identity is not None or not os.path.exists(path):
+                    continue
+                if state == 'committed':
+                    logging.info(f'Keeping committed output of interrupted task: {path}')
+                    continue
+                if not intact:
+                    logging.warning(f'Keeping output of interrupted task, since its inputs changed: {path}')
+                    continue
+                logging.info(f'Removing partial output: {path}')
+                os.remove(path)
+            with self.lock:
+                self.conn.execute('DELETE FROM tasks WHERE key=?', (key,))
+                self.conn.commit()
+        return len(rows)
+
+# Journal used when applying plans, if enabled
+plan_journal = None
+
+def get_journal():
+    return plan_journal
+
+def set_journal(journal):
+    global plan_journal
+    plan_journal = journal
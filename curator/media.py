@@ -1,24 +1,62 @@
+import collections
+import concurrent.futures
 import functools
 import glob
 import json
-import operator
+import logging
 import os
 import subprocess
 
+from .cache import file_identity, get_probe_cache
+from .formats import matroska
+from .query import parse_query
 from .stream import *
 
 # Extensions
-VIDEO_EXTENSIONS = ['avi', 'flv', 'm4v', 'mkv', 'mov', 'mp4', 'mpg', 'wmv']
-AUDIO_EXTENSIONS = ['mp3', 'aac', 'ogg']
-TEXTS_EXTENSIONS = ['srt', 'ass']
+VIDEO_EXTENSIONS = ['3gp', 'avi', 'flv', 'm2ts', 'm4v', 'mkv', 'mov', 'mp4', 'mpeg', 'mpg', 'ogv', 'ts', 'vob', 'webm', 'wmv']
+AUDIO_EXTENSIONS = ['aac', 'ac3', 'dts', 'eac3', 'flac', 'm4a', 'mka', 'mp3', 'ogg', 'opus', 'wav', 'wma']
+TEXTS_EXTENSIONS = ['ass', 'mks', 'srt', 'ssa', 'sub', 'vtt']
+MATROSKA_EXTENSIONS = ['mka', 'mks', 'mkv', 'webm']
+MEDIA_EXTENSIONS = set(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS + TEXTS_EXTENSIONS + MATROSKA_EXTENSIONS)
+
+class ProbeInfo(dict):
+    """
+    Partial media/stream information obtained without ffprobe.
+    Accessing keys it cannot answer triggers a complete probe, updating it in place.
+    """
+    def __init__(self, info, loader):
+        super().__init__(info)
+        self.loader = loader
+
+    def complete(self):
+        if self.loader is not None:
+            self.update(self.loader())
+            self.loader = None
+
+    def __missing__(self, key):
+        self.complete()
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if not dict.__contains__(self, key):
+            self.complete()
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if not dict.__contains__(self, key):
+            self.complete()
+        return dict.get(self, key, default)
 
 class Media:
     # Type
     TYPE_FILE = 1
     TYPE_LINK = 2
 
-    def __init__(self, path, type=None):
+    def __init__(self, path, type=None, entry=None):
         self.path = path
+        self.entry = entry
 
         # Detect regular file or link
         if type is None:
@@ -38,11 +76,20 @@ class Media:
         # Cache media information
         self.info = None
         self.streams = None
+        self.chapters = None
+        self.typed_streams = None
         self.packets = None
+        self.ffprobe_result = None
 
     def __repr__(self):
         return f'Media("{self.name}")'
 
+    def stat(self):
+        # Reuse stat results from directory scans if available
+        if self.entry is not None:
+            return self.entry.stat()
+        return os.stat(self.path)
+
     def has_video_ext(self):
         return self.ext in VIDEO_EXTENSIONS
 
@@ -53,47 +100,152 @@ class Media:
         return self.ext in TEXTS_EXTENSIONS
 
     def has_video(self):
-        return any(map(lambda s: s.is_video(), self.get_streams()))
+        return len(self.video_streams) > 0
 
     def has_audio(self):
-        return any(map(lambda s: s.is_audio(), self.get_streams()))
+        return len(self.audio_streams) > 0
 
     def has_subtitle(self):
-        return any(map(lambda s: s.is_subtitle(), self.get_streams()))
+        return len(self.subtitle_streams) > 0
 
     def has_video_codec(self, codec_name):
-        return any(map(lambda s: s.is_video() and s.get_info()['codec_name'] == codec_name,
-            self.get_streams()))
+        return any(map(lambda s: s.get_info()['codec_name'] == codec_name, self.video_streams))
 
     def has_subtitle_codec(self, codec_name):
-        return any(map(lambda s: s.is_subtitle() and s.get_info()['codec_name'] == codec_name,
-            self.get_streams()))
+        return any(map(lambda s: s.get_info()['codec_name'] == codec_name, self.subtitle_streams))
 
     def has_packed_bframes(self):
         if self.get_info()['format_name'] != 'avi':
             return False
-        for stream in self.get_streams():
-            if stream.is_video() and stream.has_packed_bframes():
+        for stream in self.video_streams:
+            if stream.has_packed_bframes():
                 return True
         return False
 
     def is_format(self, name):
         return name in self.get_info()['format_name'].split(',')
 
-    def get_info(self):
-        if self.info:
-            return self.info
+    def probe(self):
+        """
+        Obtain format, streams and chapters information, preferring in this order:
+        the probe cache, native parsing of Matroska headers and ffprobe.
+        Native results are cached as well, tagged with their source, so they stay partial.
+        """
+        cache = get_probe_cache()
+        stat = self.stat() if cache else None
+        probe = cache.get(self.path, 'probe', stat) if cache else None
+        if probe is None and self.ext.lower() in MATROSKA_EXTENSIONS:
+            try:
+                probe = matroska.read_probe(self.path)
+            except Exception as e:
+                logging.debug(f'Failed to parse Matroska headers in {self.path}: {e}')
+            if probe is not None:
+                probe['source'] = 'matroska'
+                if cache:
+                    cache.put(self.path, 'probe', probe, stat)
+        if probe is not None and probe.get('source') == 'matroska':
+            self.load_partial_probe(probe)
+            return
+        if probe is None:
+            probe = self.ffprobe()
+
+        # Cache format, chapters and stream objects
+        self.info = probe['format']
+        self.chapters = probe.get('chapters', [])
+        streams = []
+        for stream_info in probe.get('streams', []):
+            stream_info.setdefault('tags', {})
+            stream = Stream(self, stream_info['index'], stream_info)
+            streams.append(stream)
+        self.load_streams(streams)
+
+    def load_streams(self, streams):
+        # Precompute type-relative indices and per-type views of streams
+        self.streams = streams
+        self.typed_streams = {}
+        for stream in streams:
+            stream.type_indices = { k: len(v) for k, v in self.typed_streams.items() }
+            codec_type = stream.get_info().get('codec_type')
+            self.typed_streams.setdefault(codec_type, []).append(stream)
+
+    def get_typed_streams(self, codec_type):
+        if self.streams is None:
+            self.probe()
+        return self.typed_streams.get(codec_type, [])
+
+    @property
+    def video_streams(self):
+        return self.get_typed_streams('video')
+
+    @property
+    def audio_streams(self):
+        return self.get_typed_streams('audio')
+
+    @property
+    def subtitle_streams(self):
+        return self.get_typed_streams('subtitle')
+
+    @property
+    def data_streams(self):
+        return self.get_typed_streams('data')
+
+    def load_partial_probe(self, probe):
+        # Missing keys are obtained from a complete ffprobe invocation on first access
+        self.info = ProbeInfo(probe['format'], lambda: self.ffprobe()['format'])
+        self.info['tags'] = ProbeInfo(self.info['tags'], lambda: self.ffprobe()['format'].get('tags', {}))
+        streams = []
+        for stream_info in probe['streams']:
+            index = stream_info['index']
+            stream_info = ProbeInfo(stream_info, functools.partial(self.ffprobe_stream, index))
+            if 'disposition' in stream_info:
+                stream_info['disposition'] = ProbeInfo(stream_info['disposition'],
+                    functools.partial(self.ffprobe_stream, index, 'disposition'))
+            stream = Stream(self, index, stream_info)
+            streams.append(stream)
+        self.load_streams(streams)
+
+    def ffprobe(self):
+        """
+        Obtain format, streams and chapters information with a single ffprobe invocation.
+        """
+        if self.ffprobe_result is not None:
+            return self.ffprobe_result
+        cache = get_probe_cache()
+        stat = self.stat() if cache else None
         cmd = ['ffprobe', self.path]
         cmd += ['-show_format']
+        cmd += ['-show_streams']
+        cmd += ['-show_chapters']
         cmd += ['-of', 'json']
         result = subprocess.run(cmd, capture_output=True)
         if result.returncode != 0:
             errors = result.stderr.decode('utf-8')
-            raise Exception(f"Failed to  get info from {self.path} with ffmpeg:\n{errors}")
+            raise Exception(f"Failed to get info from {self.path} with ffmpeg:\n{errors}")
         output = result.stdout.decode('utf-8')
-        self.info = json.loads(output)['format']
+        probe = json.loads(output)
+        for stream_info in probe.get('streams', []):
+            stream_info.setdefault('tags', {})
+        if cache:
+            cache.put(self.path, 'probe', probe, stat)
+        self.ffprobe_result = probe
+        return probe
+
+    def ffprobe_stream(self, index, key=None):
+        stream_info = self.ffprobe()['streams'][index]
+        return stream_info if key is None else stream_info.get(key, {})
+
+    def get_info(self):
+        if self.info is None:
+            self.probe()
         return self.info
 
+    def get_chapters(self):
+        if self.chapters is None:
+            self.probe()
+        if self.chapters is None:
+            self.chapters = self.ffprobe().get('chapters', [])
+        return self.chapters
+
     def get_packets(self):
         if self.packets:
             return self.packets
@@ -109,82 +261,157 @@ class Media:
         return self.packets
 
     def get_streams(self):
-        if self.streams is not None:
-            return self.streams
-
-        # Obtain information about streams within media
-        cmd = ['ffprobe', self.path]
-        cmd += ['-show_streams']
-        cmd += ['-of', 'json']
-        result = subprocess.run(cmd, capture_output=True)
-        if result.returncode != 0:
-            errors = result.stderr.decode('utf-8')
-            raise Exception(f"Failed get info from {self.path} with ffmpeg:\n{errors}")
-        output = result.stdout.decode('utf-8')
-        streams_info = json.loads(output)['streams']
-
-        # Create and return stream objects
-        streams = []
-        for stream_info in streams_info:
-            stream_info.setdefault('tags', {})
-            stream = Stream(self, stream_info['index'], stream_info)
-            streams.append(stream)
-        self.streams = streams
-        return streams
+        if self.streams is None:
+            self.probe()
+        return self.streams
 
     def num_streams():
         return len(get_streams())
 
+    def extract_subtitles(self, streams, output_dir):
+        """
+        Extract text subtitle streams into SRT files in a single ffmpeg run, demuxing the file once.
+        Returns a dictionary mapping stream indices to the paths of the extracted files.
+        """
+        streams = [s for s in streams if s.is_subtitle() and s.is_text_subtitle()]
+        if not streams:
+            return {}
+        outputs = {}
+        cmd = ['ffmpeg', '-nostdin', '-i', self.path]
+        for stream in streams:
+            output = os.path.join(output_dir, f'stream{stream.index}.srt')
+            cmd += ['-map', f'0:{stream.index}']
+            if stream.get_info()['codec_name'] in ('srt', 'subrip'):
+                cmd += ['-c:s', 'copy']
+            cmd += [output]
+            outputs[stream.index] = output
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            errors = result.stderr.decode('utf-8')
+            raise Exception(f"Failed to extract subtitles from {self.path} with ffmpeg:\n{errors}")
+        return outputs
 
-def parse_query(query):
-    lhs, rhs = query.split('=')
-    path = lhs.split('.')
-    return { 'lhs_path': path, 'op': operator.eq, 'rhs_value': rhs }
 
 def filter_streams(streams, query):
-    results = []
     query = parse_query(query)
-    for stream in streams:
-        try:
-            lhs = functools.reduce(dict.get, query['lhs_path'], stream.get_info())
-        except TypeError:
-            continue
-        rhs = query['rhs_value']
-        if query['op'](lhs, rhs):
-            results.append(stream)
-    return results
+    return [stream for stream in streams if query.match(stream.get_info())]
 
 def filter_check(media, queries):
     if not queries:
         return True
-    streams = media.get_streams()
+    queries = list(map(parse_query, queries))
     for query in queries:
-        streams = filter_streams(streams, query)
+        if query.media_level and not query.match(media.get_info()):
+            return False
+    streams = None
+    for query in queries:
+        if query.media_level:
+            continue
+        streams = filter_streams(media.get_streams() if streams is None else streams, query)
         if len(streams) == 0:
             return False
     return True
 
-def media_input(paths, recursive=False, queries=[]):
-    media = []
+def filter_cached(queries):
+    """
+    Evaluate queries over the probe cache index, returning a function that checks media
+    without opening it, or returns None if the media is not indexed or has changed.
+    """
+    cache = get_probe_cache()
+    if not cache or cache.refresh or not queries:
+        return lambda m: None
+    identities, matches = cache.select(queries)
+    def check(m):
+        path = os.path.abspath(m.path)
+        identity = identities.get(path)
+        if identity is None:
+            return None
+        try:
+            if identity != file_identity(path, m.stat()):
+                return None
+        except OSError:
+            return None
+        return path in matches
+    return check
+
+def media_scan(path, recursive=False, visited=None):
+    """
+    Yield media files with known extensions inside a directory, lazily and sorted by name.
+    Symbolic links to directories are followed, but each directory is only visited once.
+    """
+    if visited is None:
+        visited = set()
+    st = os.stat(path)
+    if (st.st_dev, st.st_ino) in visited:
+        return
+    visited.add((st.st_dev, st.st_ino))
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_file():
+            ext = os.path.splitext(entry.name)[1][1:].lower()
+            if ext in MEDIA_EXTENSIONS:
+                yield Media(entry.path, Media.TYPE_FILE, entry)
+        elif recursive and entry.is_dir():
+            yield from media_scan(entry.path, recursive, visited)
+
+def media_paths(paths, recursive=False):
+    """
+    Yield media from files, directories and wildcards.
+    """
     for path in paths:
         # Add files
         if os.path.isfile(path):
-            m = Media(path)
-            if filter_check(m, queries):
-                media.append(m)
+            yield Media(path, Media.TYPE_FILE)
         # Add directories
         elif os.path.isdir(path):
-            path = os.path.join(path, '*')
-            for path in glob.glob(path, recursive=recursive):
-                if os.path.isfile(path):
-                    m = Media(path)
-                    if filter_check(m, queries):
-                        media.append(m)
+            yield from media_scan(path, recursive)
         # Add wildcards (needed for Windows)
         elif '*' in path:
-            for path in glob.glob(path, recursive=recursive):
+            for path in glob.iglob(path, recursive=recursive):
                 if os.path.isfile(path):
-                    m = Media(path)
-                    if filter_check(m, queries):
-                        media.append(m)
-    return media
+                    yield Media(path, Media.TYPE_FILE)
+
+def media_filter(media, queries=[], jobs=1, probe=False):
+    """
+    Yield media matching all queries, preserving input order.
+    Probing and filtering runs in a pool of `jobs` threads with a bounded number of
+    media in flight. Optionally, media is probed even without queries to warm up
+    metadata used by plans.
+    """
+    queries = list(map(parse_query, queries))
+    check_cached = filter_cached(queries)
+    def check(m):
+        matched = check_cached(m)
+        if matched is None:
+            matched = filter_check(m, queries)
+        if matched and probe:
+            m.get_streams()
+        return matched
+    if not queries and not probe:
+        yield from media
+        return
+    if jobs <= 1:
+        for m in media:
+            if check(m):
+                yield m
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        for m in media:
+            pending.append((m, executor.submit(check, m)))
+            if len(pending) >= 2 * jobs:
+                m, future = pending.popleft()
+                if future.result():
+                    yield m
+        while pending:
+            m, future = pending.popleft()
+            if future.result():
+                yield m
+
+def media_iter(paths, recursive=False, queries=[], jobs=1, probe=False):
+    media = media_paths(paths, recursive)
+    return media_filter(media, queries, jobs, probe)
+
+def media_input(paths, recursive=False, queries=[], jobs=1, probe=False):
+    return list(media_iter(paths, recursive, queries, jobs, probe))
@@ -0,0 +1,151 @@
+import glob
+import hashlib
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+from .cache import file_identity, get_probe_cache
+
+# Packet/frame flags
+FLAG_KEY = 0x1
+FLAG_DISCARD = 0x2
+FLAG_CORRUPT = 0x4
+
+# Value of unavailable fields (e.g. packets without PTS)
+NOPTS = np.iinfo(np.int64).min
+
+# Columns of packet and frame indices
+INDEX_DTYPE = np.dtype([
+    ('pts', np.int64),
+    ('dts', np.int64),
+    ('duration', np.int64),
+    ('size', np.int64),
+    ('pos', np.int64),
+    ('flags', np.uint8),
+])
+
+# Map ffprobe keys into index columns
+INDEX_ENTRIES = {
+    'packet': 'pts,dts,duration,size,pos,flags',
+    'frame': 'key_frame,pts,pkt_dts,duration,pkt_duration,pkt_pos,pkt_size',
+}
+INDEX_KEYS = {
+    'pts': 'pts',
+    'dts': 'dts',
+    'pkt_dts': 'dts',
+    'duration': 'duration',
+    'pkt_duration': 'duration',
+    'size': 'size',
+    'pkt_size': 'size',
+    'pos': 'pos',
+    'pkt_pos': 'pos',
+}
+
+# Number of rows allocated at once while parsing
+INDEX_CHUNK_ROWS = 0x10000
+
+def parse_flags(value):
+    flags = 0
+    if 'K' in value:
+        flags |= FLAG_KEY
+    if 'D' in value:
+        flags |= FLAG_DISCARD
+    if 'C' in value:
+        flags |= FLAG_CORRUPT
+    return flags
+
+def parse_index(lines):
+    """
+    Parse ffprobe compact output lines (e.g. `pts=0|dts=0|...`) into an index.
+    Rows are stored in fixed-size chunks, so no per-packet objects are retained.
+    """
+    chunks = []
+    chunk = np.empty(INDEX_CHUNK_ROWS, dtype=INDEX_DTYPE)
+    count = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        row = [NOPTS, NOPTS, NOPTS, NOPTS, NOPTS, 0]
+        for field in line.split('|'):
+            key, _, value = field.partition('=')
+            if key == 'flags':
+                row[5] = parse_flags(value)
+            elif key == 'key_frame':
+                row[5] |= FLAG_KEY if value == '1' else 0
+            elif key in INDEX_KEYS and value not in ('', 'N/A'):
+                row[INDEX_DTYPE.names.index(INDEX_KEYS[key])] = int(value)
+        chunk[count] = tuple(row)
+        count += 1
+        if count == INDEX_CHUNK_ROWS:
+            chunks.append(chunk)
+            chunk = np.empty(INDEX_CHUNK_ROWS, dtype=INDEX_DTYPE)
+            count = 0
+    chunks.append(chunk[:count])
+    return np.concatenate(chunks)
+
+def read_index(path, stream_index, kind, intervals=None):
+    """
+    Obtain the packet or frame index of a stream by streaming ffprobe output.
+    """
+    assert(kind in INDEX_ENTRIES)
+    cmd = ['ffprobe', path]
+    cmd += ['-v', 'error']
+    cmd += ['-select_streams', str(stream_index)]
+    cmd += [f'-show_{kind}s']
+    cmd += ['-show_entries', f'{kind}={INDEX_ENTRIES[kind]}']
+    if intervals:
+        cmd += ['-read_intervals', intervals]
+    cmd += ['-of', 'compact=p=0']
+    with tempfile.TemporaryFile() as stderr:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr) as proc:
+            lines = (line.decode('utf-8') for line in proc.stdout)
+            index = parse_index(lines)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            errors = stderr.read().decode('utf-8')
+            raise Exception(f"Failed to get {kind}s from {path} with ffmpeg:\n{errors}")
+    return index
+
+def index_cache_path(cache, path, stream_index, kind):
+    """
+    Path of a cached index, named after the stream followed by the identity of its file,
+    so that indices of modified files can be found and replaced.
+    """
+    path = os.path.abspath(path)
+    key = hashlib.sha1(repr((path, stream_index, kind)).encode('utf-8')).hexdigest()
+    identity = hashlib.sha1(repr(file_identity(path)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache.cache, 'index', f'{key}-{identity}.npy')
+
+def store_index(index_path, index):
+    """
+    Persist an index atomically, removing cached indices of previous versions of the file.
+    """
+    directory = os.path.dirname(index_path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.npy', delete=False) as f:
+        np.save(f, index)
+    os.replace(f.name, index_path)
+    key = os.path.basename(index_path).split('-')[0]
+    for stale in glob.glob(os.path.join(glob.escape(directory), f'{key}-*.npy')):
+        if stale != index_path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass # Still memory-mapped on platforms locking open files
+
+def load_index(path, stream_index, kind):
+    """
+    Obtain the packet or frame index of a stream.
+    If the probe cache is enabled, the index is persisted next to it and memory-mapped.
+    """
+    cache = get_probe_cache()
+    if not cache:
+        return read_index(path, stream_index, kind)
+    index_path = index_cache_path(cache, path, stream_index, kind)
+    if not cache.refresh and os.path.exists(index_path):
+        return np.load(index_path, mmap_mode='r')
+    store_index(index_path, read_index(path, stream_index, kind))
+    return np.load(index_path, mmap_mode='r')
@@ -1,9 +1,84 @@
+import collections
+import concurrent.futures
 import logging
 import os
+import shutil
+import threading
+
+from .journal import get_journal
 
 # Configuration
 DEFAULT_UI_BACKEND = 'tui'
 
+def task_paths(task):
+    """
+    Absolute paths of all files read or written by a task.
+    """
+    return set(os.path.abspath(media.path) for media in task.inputs + task.outputs)
+
+def existing_path(path):
+    """
+    Path itself if it exists, or its closest existing ancestor directory.
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def path_device(path):
+    return os.stat(existing_path(path)).st_dev
+
+def task_devices(task):
+    return set(path_device(path) for path in task_paths(task))
+
+class DeviceAdmission:
+    """
+    Admission control for tasks, limiting the number of concurrent tasks per device and
+    ensuring that devices have enough free space for the outputs of all running tasks.
+    """
+    def __init__(self, device_jobs=None):
+        self.device_jobs = device_jobs
+        self.running = collections.Counter()
+        self.reserved = collections.Counter()
+        self.devices = {}
+        self.space = {}
+
+    def prepare(self, task):
+        self.devices[task.id] = task_devices(task)
+        space = collections.Counter()
+        for directory, size in task.required_space():
+            directory = existing_path(directory)
+            space[(path_device(directory), directory)] += size
+        self.space[task.id] = space
+
+    def check(self, task):
+        """
+        Returns whether the task can start now, or None if it can never start.
+        """
+        devices = self.devices[task.id]
+        if self.device_jobs and any(self.running[d] >= self.device_jobs for d in devices):
+            return False
+        for (device, directory), size in self.space[task.id].items():
+            if shutil.disk_usage(directory).free - self.reserved[device] >= size:
+                continue
+            # Running tasks might release space, e.g. by deleting their inputs
+            if self.running[device] > 0:
+                return False
+            return None
+        return True
+
+    def acquire(self, task):
+        for device in self.devices[task.id]:
+            self.running[device] += 1
+        for (device, _), size in self.space[task.id].items():
+            self.reserved[device] += size
+
+    def release(self, task):
+        for device in self.devices[task.id]:
+            self.running[device] -= 1
+        for (device, _), size in self.space[task.id].items():
+            self.reserved[device] -= size
+
 class Plan:
     def __init__(self):
         self.tasks = []
@@ -41,14 +116,85 @@ class Plan:
                     task.add_error(f'Output {path} already exists in the filesystem')
                 outputs.add(path)
 
-    def apply(self):
-        for task in self.tasks:
-            if task.enabled:
-                try:
-                    task.apply()
-                except Exception as e:
-                    task.failed = True
-                    print(f'Task #{task.id} with input {task.inputs[0]} failed:\n{e}')
+    def apply(self, jobs=1, device_jobs=None):
+        tasks = [task for task in self.tasks if task.enabled]
+
+        # Tasks sharing any file run in plan order, while disjoint tasks run concurrently
+        dependents = { task.id: [] for task in tasks }
+        dependencies = { task.id: 0 for task in tasks }
+        last_tasks = {}
+        for task in tasks:
+            previous = set(last_tasks[path] for path in task_paths(task) if path in last_tasks)
+            for other in previous:
+                dependents[other.id].append(task)
+                dependencies[task.id] += 1
+            for path in task_paths(task):
+                last_tasks[path] = task
+
+        admission = DeviceAdmission(device_jobs)
+        lock = threading.Lock()
+        ready = []
+        def fail(task, error):
+            task.failed = True
+            with lock:
+                print(f'Task #{task.id} with input {task.inputs[0]} failed:\n{error}')
+        def finish(task):
+            for other in dependents[task.id]:
+                dependencies[other.id] -= 1
+                if dependencies[other.id] == 0:
+                    ready.append(other)
+            ready.sort(key=lambda t: t.id)
+
+        for task in tasks:
+            try:
+                admission.prepare(task)
+            except OSError as e:
+                fail(task, e)
+            if dependencies[task.id] == 0:
+                ready.append(task)
+        with concurrent.futures.ThreadPoolExecutor(max(1, jobs)) as executor:
+            running = {}
+            while ready or running:
+                # Start ready tasks in plan order, as long as workers and devices are available
+                for task in list(ready):
+                    if len(running) >= max(1, jobs):
+                        break
+                    if task.failed:
+                        ready.remove(task)
+                        finish(task)
+                        continue
+                    admitted = admission.check(task)
+                    if admitted is None:
+                        fail(task, 'Not enough free space for its outputs')
+                        ready.remove(task)
+                        finish(task)
+                    elif admitted:
+                        admission.acquire(task)
+                        ready.remove(task)
+                        running[executor.submit(self.apply_task, task, lock)] = task
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    admission.release(task)
+                    finish(task)
+
+    def apply_task(self, task, lock=None):
+        journal = get_journal()
+        try:
+            key = journal.start(task) if journal else None
+            task.apply()
+            if journal:
+                journal.finish(key, task)
+        except Exception as e:
+            task.failed = True
+            message = f'Task #{task.id} with input {task.inputs[0]} failed:\n{e}'
+            if lock is None:
+                print(message)
+                return
+            with lock:
+                print(message)
 
     def show(self):
         from .tui import print_plan
@@ -1,5 +1,6 @@
 # Imports
 from .convert import *
+from .fuse import *
 from .link import *
 from .merge import *
 from .rename import *
@@ -8,6 +9,7 @@ from .tag import *
 
 # Prevent polluting namespace
 del convert
+del fuse
 del link
 del merge
 del rename
@@ -1,10 +1,9 @@
 import logging
 import os
 import subprocess
-import tempfile
 
 from curator import Plan, Task, Media
-from curator.util import flatten
+from curator.util import flatten, run_pipeline
 
 class ConvertPlan(Plan):
     def columns(self):
@@ -29,63 +28,106 @@ class ConvertTask(Task):
     def view(self):
         return [(self.inputs[0].name, "→", self.outputs[0].name)]
 
-    def apply(self):
-        temp = None
+    def required_space(self):
+        return [(self.outputs[0].dir, os.path.getsize(self.inputs[0].path))]
+
+    def needs_unpacking(self):
         # Solve conflict when -fflags +genpts and -bsf:v mpeg4_unpack_bframes are both enabled
-        input_media = self.inputs[0].path
-        if self.unpack_bframes and '+genpts' in self.fflags:
-            temp = tempfile.TemporaryDirectory(dir=self.inputs[0].dir, prefix='.temp-curator-')
-            fixed_media = os.path.join(temp.name, "media.avi")
-            cmd = ['ffmpeg']
-            cmd += ['-i', input_media]
-            cmd += ['-c:v', 'copy']
-            cmd += ['-c:a', 'copy']
-            cmd += ['-bsf:v', 'mpeg4_unpack_bframes']
-            cmd += ['-map', '0']
-            if self.skip_subtitles:
-                cmd += ['-map', '-0:s']
-            cmd += ['-map_metadata', '0']
-            cmd += ['-movflags', 'use_metadata_tags']
-            cmd += [fixed_media]
-            result = subprocess.run(cmd, capture_output=True)
-            if result.returncode != 0:
-                errors = result.stderr.decode('utf-8')
-                raise Exception(f"Failed to generate PTS for {self.inputs[0].name} with ffmpeg:\n{errors}")
-            input_media = fixed_media
+        return self.unpack_bframes and '+genpts' in self.fflags
 
-        # Build ffmpeg command
+    def unpack_command(self):
+        """
+        First stage of conversions requiring B-frame unpacking before generating PTS.
+        Streams AVI with unpacked B-frames and without dropped streams to standard output,
+        since unlike other containers it accepts packets without PTS.
+        """
         cmd = ['ffmpeg']
+        cmd += ['-i', self.inputs[0].path]
+        cmd += ['-c', 'copy']
+        cmd += ['-bsf:v', 'mpeg4_unpack_bframes']
+        cmd += self.map_args()
+        cmd += ['-map_metadata', '0']
+        cmd += ['-f', 'avi', 'pipe:1']
+        return cmd
+
+    def input_args(self):
+        args = []
         if self.fflags:
-            cmd += ['-fflags', ''.join(self.fflags)]
-        cmd += ['-i', input_media]
-        cmd += ['-c:v', 'copy']
-        cmd += ['-c:a', 'copy']
-        cmd += ['-c:s', 'copy']
-        cmd += ['-c:d', 'copy']
-        cmd += ['-c:t', 'copy']
+            args += ['-fflags', ''.join(self.fflags)]
+        if self.needs_unpacking():
+            args += ['-f', 'avi', '-i', 'pipe:0']
+        else:
+            args += ['-i', self.inputs[0].path]
+        return args
+
+    def codec_args(self):
+        args = []
+        args += ['-c:v', 'copy']
+        args += ['-c:a', 'copy']
+        args += ['-c:s', 'copy']
+        args += ['-c:d', 'copy']
+        args += ['-c:t', 'copy']
         if self.cflags:
-            cmd += flatten(self.cflags)
+            args += flatten(self.cflags)
         if self.unpack_bframes and '+genpts' not in self.fflags:
-            cmd += ['-bsf:v', 'mpeg4_unpack_bframes']
-        cmd += ['-map', '0']
+            args += ['-bsf:v', 'mpeg4_unpack_bframes']
+        return args
+
+    def map_args(self):
+        args = ['-map', '0']
         if self.skip_subtitles:
-            cmd += ['-map', '-0:s']
+            args += ['-map', '-0:s']
         if self.mflags:
-            cmd += flatten(self.mflags)
+            args += flatten(self.mflags)
+        return args
+
+    def dropped_streams(self):
+        """
+        Indices of input streams excluded from the output.
+        """
+        dropped = set()
+        for flag in self.mflags:
+            if flag[0] == '-map' and flag[1].startswith('-0:') and flag[1][3:].isdigit():
+                dropped.add(int(flag[1][3:]))
+        if self.skip_subtitles:
+            dropped |= set(s.index for s in self.inputs[0].subtitle_streams)
+        return dropped
+
+    def run(self, cmd):
+        """
+        Run an ffmpeg command reading from the input, piping it through the unpacking stage if required.
+        """
+        if not self.needs_unpacking():
+            result = subprocess.run(cmd, capture_output=True)
+            return result.returncode, result.stderr.decode('utf-8')
+        (code_unpack, errors_unpack), (code, errors) = run_pipeline([self.unpack_command(), cmd])
+        if code_unpack != 0 and code == 0:
+            code = code_unpack
+        if code_unpack != 0:
+            errors = f"Failed to generate PTS for {self.inputs[0].name} with ffmpeg:\n{errors_unpack}\n{errors}"
+        return code, errors
+
+    def apply(self):
+        # Build ffmpeg command
+        cmd = ['ffmpeg']
+        cmd += self.input_args()
+        cmd += self.codec_args()
+        if self.needs_unpacking():
+            cmd += ['-map', '0']
+        else:
+            cmd += self.map_args()
         cmd += ['-map_metadata', '0']
         cmd += ['-movflags', 'use_metadata_tags']
 
         # Create output file
         output = self.outputs[0].path
         cmd += [output]
-        result = subprocess.run(cmd, capture_output=True)
-        if temp:
-            temp.cleanup()
-        if result.returncode != 0:
+        code, errors = self.run(cmd)
+        if code != 0:
             if os.path.exists(output):
                 os.remove(output)
-            errors = result.stderr.decode('utf-8')
             raise Exception(f"Failed to convert to {output} with ffmpeg:\n{errors}")
+        self.commit()
         if self.delete:
             os.remove(self.inputs[0].path)
 
@@ -98,6 +140,49 @@ class ConvertTask(Task):
     def add_mflag(self, flag):
         self.mflags.add(flag)
 
+def convert_task(m, output, format, delete=False):
+    """
+    Create a task converting a media into the given format, with any tweaks it requires.
+    """
+    task = ConvertTask(m, output, format, delete)
+
+    # Tweaks for mismatching formats
+    if m.get_info()['format_name'] in ('avi', 'ogg') and m.has_video():
+        task.add_warning(f'Media contains packets without PTS data.')
+        task.add_fflag('+genpts')
+    if m.get_info()['format_name'] == 'avi' and m.has_video_codec('h264'):
+        task.add_error('AVI contains H264 stream. Unpacking is required, but not supported.')
+    if m.get_info()['format_name'] == 'avi' and m.has_subtitle():
+        task.skip_subtitles = True
+        task.add_warning('AVI contains subtitles. Conversion is not supported.')
+    if m.has_packed_bframes():
+        task.unpack_bframes = True
+        task.add_warning(f'Media contains packed B-frames. Unpacking is required.')
+    if format == 'mkv':
+        for stream in m.get_streams():
+            # Reencode MP4/TX3G to MKV/SRT
+            if stream.get_info()['codec_type'] == "subtitle" and \
+               stream.get_info()['codec_name'] == "mov_text":
+                task.add_warning(f'Conversion requires reencoding {stream}. Styles will be removed.')
+                task.add_cflag(('-c:s', 'text'))
+    if format == 'mkv':
+        for stream in m.get_streams():
+            # Drop MP4/TMCD
+            if stream.get_info()['codec_type'] == "data" and \
+               stream.get_info()['tags'].get('handler_name') == "Time Code Media Handler":
+                task.add_warning('Chapters have been included in {stream}. Stream will be dropped.')
+                task.add_mflag(('-map', f'-0:{stream.index}'))
+            if stream.get_info()['codec_type'] == "data" and \
+               stream.get_info()['tags'].get('handler_name') == "SubtitleHandler":
+                task.add_warning('Chapters have been included in {stream}. Stream will be dropped, but chapters might be carried over by ffmpeg.')
+                task.add_mflag(('-map', f'-0:{stream.index}'))
+            # Drop binary data
+            if stream.get_info()['codec_type'] == "data" and \
+               stream.get_info()['codec_name'] == "bin_data":
+                task.add_warning('Binary data has been included in {stream}. Stream will be dropped.')
+                task.add_mflag(('-map', f'-0:{stream.index}'))
+    return task
+
 def plan_convert(media, format, delete=False):
     plan = ConvertPlan()
     for m in media:
@@ -107,42 +192,6 @@ def plan_convert(media, format, delete=False):
             logging.debug(f'Skipping existing output: {output_path}')
             continue
         output_media = Media(output_path, Media.TYPE_FILE)
-        task = ConvertTask(m, output_media, format, delete)
-
-        # Tweaks for mismatching formats
-        if m.get_info()['format_name'] in ('avi', 'ogg') and m.has_video():
-            task.add_warning(f'Media contains packets without PTS data.')
-            task.add_fflag('+genpts')
-        if m.get_info()['format_name'] == 'avi' and m.has_video_codec('h264'):
-            task.add_error('AVI contains H264 stream. Unpacking is required, but not supported.')
-        if m.get_info()['format_name'] == 'avi' and m.has_subtitle():
-            task.skip_subtitles = True
-            task.add_warning('AVI contains subtitles. Conversion is not supported.')
-        if m.has_packed_bframes():
-            task.unpack_bframes = True
-            task.add_warning(f'Media contains packed B-frames. Unpacking is required.')
-        if format == 'mkv':
-            for stream in m.get_streams():
-                # Reencode MP4/TX3G to MKV/SRT
-                if stream.get_info()['codec_type'] == "subtitle" and \
-                   stream.get_info()['codec_name'] == "mov_text":
-                    task.add_warning(f'Conversion requires reencoding {stream}. Styles will be removed.')
-                    task.add_cflag(('-c:s', 'text'))
-        if format == 'mkv':
-            for stream in m.get_streams():
-                # Drop MP4/TMCD
-                if stream.get_info()['codec_type'] == "data" and \
-                   stream.get_info()['tags'].get('handler_name') == "Time Code Media Handler":
-                    task.add_warning('Chapters have been included in {stream}. Stream will be dropped.')
-                    task.add_mflag(('-map', f'-0:{stream.index}'))
-                if stream.get_info()['codec_type'] == "data" and \
-                   stream.get_info()['tags'].get('handler_name') == "SubtitleHandler":
-                    task.add_warning('Chapters have been included in {stream}. Stream will be dropped, but chapters might be carried over by ffmpeg.')
-                    task.add_mflag(('-map', f'-0:{stream.index}'))
-                # Drop binary data
-                if stream.get_info()['codec_type'] == "data" and \
-                   stream.get_info()['codec_name'] == "bin_data":
-                    task.add_warning('Binary data has been included in {stream}. Stream will be dropped.')
-                    task.add_mflag(('-map', f'-0:{stream.index}'))
+        task = convert_task(m, output_media, format, delete)
         plan.add_task(task)
     return plan
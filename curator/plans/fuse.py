@@ -0,0 +1,189 @@
+import collections
+import logging
+import os
+import subprocess
+
+from curator import Media
+from curator.plans.convert import convert_task
+from curator.plans.merge import DEF_OPTS_MERGE, MergePlan, MergeTask
+from curator.plans.merge import find_related, select_merge_streams, select_video_stream
+from curator.plans.tag import TagTask, find_mkvpropedit, plan_tag
+from curator.util import temp_directory
+
+class FusedPlan(MergePlan):
+    pass
+
+class FusedTask(MergeTask):
+    """
+    Convert the main input, merge related inputs into it and update stream tags,
+    writing the output with a single ffmpeg invocation.
+    """
+    FusedUpdate = collections.namedtuple('FusedUpdate', ('stream', 'tag', 'old', 'new'))
+
+    def __init__(self, inputs, output, format, delete, convert=None):
+        super().__init__(inputs, output, format, delete)
+        self.convert = convert
+        self.updates = []
+        if convert:
+            self.warnings |= convert.warnings
+            for error in convert.errors:
+                self.add_error(error)
+
+    def view(self):
+        rows = super().view()
+        if not rows:
+            rows.append((self.inputs[0].name, '→', self.outputs[0].name))
+        for update in self.updates:
+            rows.append((f' - {update.stream}: {update.tag} {update.old} → {update.new}', '', ''))
+        return rows
+
+    def add_update(self, stream, tag, old, new):
+        self.updates.append(self.FusedUpdate(stream, tag, old, new))
+
+    def is_noop(self):
+        return self.outputs[0].path == self.inputs[0].path and len(self.inputs) == 1 \
+            and not self.updates
+
+    def tag_task(self):
+        """
+        Task updating the tags of a Matroska main input in place, if nothing else changes.
+        Returns None if the output needs to be written with ffmpeg.
+        """
+        main = self.inputs[0]
+        if self.convert or len(self.inputs) > 1 or self.outputs[0].path != main.path \
+           or not main.is_format('matroska'):
+            return None
+        task = FusedTagTask(main)
+        task.use_mkvpropedit = True
+        task.path_mkvpropedit = find_mkvpropedit()
+        task.warnings |= self.warnings
+        for error in self.errors:
+            task.add_error(error)
+        for update in self.updates:
+            task.add_update(update.stream.index, update.tag, update.old, update.new)
+        return task
+
+    def select_streams(self, video, audio, subtitle):
+        # Keep every stream of the main input as converting it would, except those dropped by the conversion
+        main = self.inputs[0]
+        dropped = self.convert.dropped_streams() if self.convert else set()
+        self.selected_streams = [s for s in main.get_streams() if s.index not in dropped]
+        # Then add streams of related inputs, choosing video only among theirs
+        video = None
+        for s in self.input_video_streams():
+            if s.media is not main:
+                video = select_video_stream(video, s)
+        self.selected_streams += [s for s in [video] + audio + subtitle
+            if s is not None and s.media is not main]
+
+    def input_index(self, stream):
+        # Unpacked main inputs lack the streams dropped in the first stage
+        main = self.inputs[0]
+        if stream.media is main and self.convert and self.convert.needs_unpacking():
+            dropped = self.convert.dropped_streams()
+            return len([s for s in main.get_streams()[:stream.index] if s.index not in dropped])
+        return stream.index
+
+    def command(self, output_path):
+        main = self.inputs[0]
+        cmd = ['ffmpeg']
+        if self.convert:
+            cmd += self.convert.input_args()
+        else:
+            cmd += ['-i', main.path]
+        for minput in self.inputs[1:]:
+            cmd += ['-i', minput.path]
+        if self.convert:
+            cmd += self.convert.codec_args()
+        else:
+            cmd += ['-c', 'copy']
+        for stream in self.selected_streams:
+            index_m = self.inputs.index(stream.media)
+            index_s = self.input_index(stream)
+            cmd += ['-map', f'{index_m}:{index_s}']
+        cmd += ['-map_metadata', '0']
+        for update in self.updates:
+            index = self.selected_streams.index(update.stream)
+            cmd += [f'-metadata:s:{index}', f'{update.tag}={update.new}']
+        if self.convert:
+            cmd += ['-movflags', 'use_metadata_tags']
+        cmd += [output_path]
+        return cmd
+
+    def apply(self):
+        main = self.inputs[0]
+        output = self.outputs[0]
+
+        # Create output file
+        with temp_directory(output.dir) as tmp:
+            output_tmp = os.path.join(tmp, f'output.{output.ext}')
+            cmd = self.command(output_tmp)
+            if self.convert:
+                code, errors = self.convert.run(cmd)
+            else:
+                result = subprocess.run(cmd, capture_output=True)
+                code, errors = result.returncode, result.stderr.decode('utf-8')
+            if code != 0:
+                raise Exception(f"Failed to process {main.name} into {output.name} with ffmpeg:\n{errors}")
+            self.commit()
+            os.replace(output_tmp, output.path)
+            if self.delete:
+                for media in self.inputs:
+                    if media.path == output.path:
+                        continue # Do not accidentally remove output after in-place merges
+                    os.remove(media.path)
+
+class FusedTagTask(TagTask):
+    """
+    Update stream tags in place, shown as fused tasks are.
+    """
+    def view(self):
+        m = self.inputs[0]
+        rows = [(m.name, '→', m.name)]
+        for update in self.updates:
+            stream = m.get_streams()[update.index]
+            rows.append((f' - {stream}: {update.tag} {update.old} → {update.new}', '', ''))
+        return rows
+
+def plan_fuse(media, format, delete=False, stype='all', tag=None, value=None, skip_tagged=False,
+        tag_opts=None, merge_opts=DEF_OPTS_MERGE, audio_jobs=1, subtitle_jobs=1):
+    """
+    Plan converting, merging and tagging media at once, so each output is written only once.
+    Media with video streams are converted, and related media without video are merged into them.
+    Matroska media that only need tag updates are updated in place instead.
+    """
+    media = list(media)
+    tasks = []
+    for m in media:
+        if not m.has_video():
+            continue
+        basepath, _ = os.path.splitext(m.path)
+        output = Media(f'{basepath}.{format}', Media.TYPE_FILE)
+        if output.path != m.path and os.path.exists(output.path):
+            logging.debug(f'Skipping existing output: {output.path}')
+            continue
+        related = [r for r in find_related(m, media) if not r.has_video()]
+        convert = convert_task(m, output, format) if m.ext != format else None
+        task = FusedTask([m] + related, output, format, delete, convert)
+        select_merge_streams(task, merge_opts)
+        tasks.append(task)
+
+    # Detect tags of all inputs at once
+    if tag:
+        inputs = list({ id(m): m for task in tasks for m in task.inputs }.values())
+        tag_plan = plan_tag(inputs, stype, tag, value, skip_tagged, tag_opts,
+            audio_jobs=audio_jobs, subtitle_jobs=subtitle_jobs)
+        for tag_task in tag_plan:
+            streams = tag_task.inputs[0].get_streams()
+            for update in tag_task.updates:
+                stream = streams[update.index]
+                for task in tasks:
+                    if stream in task.selected_streams:
+                        task.add_update(stream, update.tag, update.old, update.new)
+
+    # Avoid rewriting Matroska files only to update their tags
+    plan = FusedPlan()
+    for task in tasks:
+        if not task.is_noop():
+            plan.add_task(task.tag_task() or task)
+    return plan
@@ -2,10 +2,10 @@ import glob
 import logging
 import os
 import subprocess
-import tempfile
 
 from curator import Plan, Task, Media
 from curator import VIDEO_EXTENSIONS
+from curator.util import temp_directory
 
 # Default options
 DEF_OPTS_MERGE = {
@@ -71,6 +71,10 @@ class MergeTask(Task):
                     rows.append((f' - {stream}', '↗', ''))
         return rows
 
+    def required_space(self):
+        inputs = set(stream.media.path for stream in self.selected_streams)
+        return [(self.outputs[0].dir, sum(map(os.path.getsize, inputs)))]
+
     def select_streams(self, video, audio, subtitle):
         self.selected_streams = [video]
         self.selected_streams += audio
@@ -91,13 +95,14 @@ class MergeTask(Task):
 
         # Create output file
         output = self.outputs[0]
-        with tempfile.TemporaryDirectory(dir=output.dir, prefix='.temp-curator-') as tmp:
+        with temp_directory(output.dir) as tmp:
             output_tmp = os.path.join(tmp, f'output.{output.ext}')
             cmd += [output_tmp]
             result = subprocess.run(cmd, capture_output=True)
             if result.returncode != 0:
                 errors = result.stderr.decode('utf-8')
                 raise Exception(f"Failed to merge into {output.name} with ffmpeg:\n{errors}")
+            self.commit()
             os.replace(output_tmp, output.path)
             if self.delete:
                 for media in self.inputs:
@@ -197,6 +202,43 @@ def find_related(target, media):
                 matches += list(subs)
     return matches
 
+def select_merge_streams(task, opts=DEF_OPTS_MERGE):
+    """
+    Choose which streams of the task inputs to preserve, starting with video.
+    """
+    video_stream = None
+    for s in task.input_video_streams():
+        video_stream = select_video_stream(video_stream, s)
+    # Then audio
+    audio_streams = []
+    for curr in task.input_audio_streams():
+        inserted = False
+        for index, prev in enumerate(audio_streams):
+            curr_lang = curr.get_info()['tags'].get('language')
+            prev_lang = prev.get_info()['tags'].get('language')
+            # FIXME: Do not remove anything while merging
+            if False and curr_lang == prev_lang != None:
+                audio_streams[index] = select_audio_stream(prev, curr)
+                inserted = True
+                break
+        if not inserted:
+            audio_streams.append(curr)
+    # Then subtitles
+    subtitle_streams = []
+    for curr in task.input_subtitle_streams():
+        inserted = False
+        for index, prev in enumerate(subtitle_streams):
+            curr_lang = curr.get_info()['tags'].get('language')
+            prev_lang = prev.get_info()['tags'].get('language')
+            # FIXME: Do not remove anything while merging
+            if False and curr_lang == prev_lang != None:
+                subtitle_streams[index] = select_subtitle_stream(prev, curr)
+                inserted = True
+                break
+        if not inserted:
+            subtitle_streams.append(curr)
+    task.select_streams(video_stream, audio_streams, subtitle_streams)
+
 def plan_merge(media, format, delete=False, opts=DEF_OPTS_MERGE):
     plan = MergePlan()
     # Identify related files
@@ -209,38 +251,7 @@ def plan_merge(media, format, delete=False, opts=DEF_OPTS_MERGE):
         if len(related) >= 1:
             task = MergeTask([m] + related, output, format, delete)
             plan.add_task(task)
-    # Choose which streams to preserve starting with video
+    # Choose which streams to preserve
     for task in plan:
-        video_stream = None
-        for s in task.input_video_streams():
-            video_stream = select_video_stream(video_stream, s)
-        # Then audio
-        audio_streams = []
-        for curr in task.input_audio_streams():
-            inserted = False
-            for index, prev in enumerate(audio_streams):
-                curr_lang = curr.get_info()['tags'].get('language')
-                prev_lang = prev.get_info()['tags'].get('language')
-                # FIXME: Do not remove anything while merging
-                if False and curr_lang == prev_lang != None:
-                    audio_streams[index] = select_audio_stream(prev, curr)
-                    inserted = True
-                    break
-            if not inserted:
-                audio_streams.append(curr)
-        # Then subtitles
-        subtitle_streams = []
-        for curr in task.input_subtitle_streams():
-            inserted = False
-            for index, prev in enumerate(subtitle_streams):
-                curr_lang = curr.get_info()['tags'].get('language')
-                prev_lang = prev.get_info()['tags'].get('language')
-                # FIXME: Do not remove anything while merging
-                if False and curr_lang == prev_lang != None:
-                    subtitle_streams[index] = select_subtitle_stream(prev, curr)
-                    inserted = True
-                    break
-            if not inserted:
-                subtitle_streams.append(curr)
-        task.select_streams(video_stream, audio_streams, subtitle_streams)
+        select_merge_streams(task, opts)
     return plan
@@ -36,6 +36,7 @@ class RenameTask(Task):
         src = self.inputs[0].path
         dst = self.outputs[0].path
         if not os.path.exists(dst):
+            self.commit()
             os.rename(src, dst)
 
 def normalize(filename):
@@ -2,6 +2,7 @@ import os
 import subprocess
 
 from curator import Plan, Task, Media
+from curator.util import temp_directory
 
 class SyncPlan(Plan):
     def columns(self):
@@ -47,13 +48,14 @@ class SyncTask(Task):
                 cmd += ['-map', f'0:{i}']
 
         # Generate and replace from temporary directory
-        with tempfile.TemporaryDirectory(dir=si.media.dir, prefix='.temp-curator-') as tmp:
+        with temp_directory(si.media.dir) as tmp:
             output = os.path.join(tmp, f'output.{si.media.ext}')
             cmd += [output]
             result = subprocess.run(cmd, capture_output=True)
             if result.returncode != 0:
                 errors = result.stderr.decode('utf-8')
                 raise Exception(f"Failed to sync {self.outputs[0].name} with ffmpeg:\n{errors}")
+            self.commit()
             os.replace(output, so.media.path)
 
 def plan_sync(media):
@@ -1,10 +1,15 @@
 import collections
+import concurrent.futures
+import multiprocessing
 import os
 import subprocess
 import tempfile
 import shutil
+import threading
 
 from curator import Plan, Task, Media
+from curator.formats import avi, matroska, mp4
+from curator.stream import DEF_OPTS_LANGUAGE, WhisperBatcher, select_audio_language, srt_language, srt_stream_language
 from curator.util import *
 
 class TagPlan(Plan):
@@ -50,6 +55,19 @@ class TagTask(Task):
             rows.append([self.inputs[0].name, str(update.index), str(update.old), "→", str(update.new)])
         return rows
 
+    def required_space(self):
+        # Only ffmpeg rewrites the entire file
+        if self.use_mkvpropedit and self.path_mkvpropedit:
+            return []
+        # Patching tags in place needs no space, unless it falls back to ffmpeg
+        try:
+            if self.apply_in_place(dry_run=True):
+                return []
+        except Exception:
+            pass
+        m = self.inputs[0]
+        return [(m.dir, os.path.getsize(m.path))]
+
     def add_update(self, index, tag, old, new=None):
         self.updates.append(self.TagUpdate(index, tag, old, new))
 
@@ -57,6 +75,8 @@ class TagTask(Task):
         if self.use_mkvpropedit and self.path_mkvpropedit:
             self.apply_with_mkvpropedit()
             return
+        if self.apply_in_place():
+            return
 
         m = self.inputs[0]
         cmd = ['ffmpeg']
@@ -77,15 +97,50 @@ class TagTask(Task):
                     raise Exception("RIFF IASx tags should only support up to 9 audio tracks")
                 cmd += ['-metadata', f'IAS{audio_index + 1}={update.new}']
 
-        with tempfile.TemporaryDirectory(dir=m.dir, prefix='.temp-curator-') as tmp:
+        with temp_directory(m.dir) as tmp:
             output = os.path.join(tmp, f'output.{m.ext}')
             cmd += [output]
             result = subprocess.run(cmd, capture_output=True)
             if result.returncode != 0:
                 errors = result.stderr.decode('utf-8')
                 raise Exception(f"Failed to update tags in {m.name} with ffmpeg:\n{errors}")
+            self.commit()
             os.replace(output, m.path)
 
+    def in_place_tags(self):
+        """
+        Tags that can be patched directly into the file, without rewriting it with ffmpeg.
+        Returns None if the updates cannot be applied in place.
+        """
+        m = self.inputs[0]
+        if any(update.tag != 'language' for update in self.updates):
+            return None
+        if m.is_format('matroska') or m.is_format('mp4') or m.is_format('mov'):
+            return { update.index: update.new for update in self.updates }
+        if m.is_format('avi'):
+            tags = {}
+            for update in self.updates:
+                s = m.get_streams()[update.index]
+                if not s.is_audio() or (audio_index := s.audio_index()) not in range(9):
+                    return None
+                tags[f'IAS{audio_index + 1}'] = update.new
+            return tags
+        return None
+
+    def apply_in_place(self, dry_run=False):
+        """
+        Patch language tags of Matroska, MP4/MOV and AVI files in place, if there is room for them.
+        Dry runs only check whether there is room.
+        """
+        m = self.inputs[0]
+        if (tags := self.in_place_tags()) is None:
+            return False
+        if m.is_format('avi'):
+            return avi.write_info_tags(m.path, tags, dry_run)
+        if m.is_format('matroska'):
+            return matroska.write_track_languages(m.path, tags, dry_run)
+        return mp4.write_track_languages(m.path, tags, dry_run)
+
     def apply_with_mkvpropedit(self):
         m = self.inputs[0]
         cmd = [self.path_mkvpropedit, m.path]
@@ -98,38 +153,177 @@ class TagTask(Task):
             errors = result.stderr.decode('utf-8')
             raise Exception(f"Failed to update tags in {m.name} with mkvpropedit:\n{errors}")
 
-def tag_value(stream, tag, opts=None):
+def tag_value(stream, tag, opts=None, source=None):
     try:
         if tag == 'language':
-            return stream.detect_language(opts)
+            return stream.detect_language(opts, source)
     except Exception as e:
         print(f'Could not process {stream.media.path}:\n{e}')
     return None
 
-def plan_tag(media, stype, tag, value=None, skip_tagged=False, opts=None):
-    path_mkvpropedit = find_executable('mkvpropedit', [
+def tag_sources(media, streams, tag, opts, output_dir):
+    """
+    Extract all subtitle streams whose language must be detected at once,
+    if there are several of them.
+    """
+    if tag != 'language' or media.ext == 'srt':
+        return {}
+    streams = [s for s in streams if s.is_subtitle() and s.is_text_subtitle()]
+    streams = [s for s in streams if not s.has_cached_language(opts)]
+    if len(streams) < 2:
+        return {}
+    try:
+        return media.extract_subtitles(streams, output_dir)
+    except Exception as e:
+        print(f'Could not process {media.path}:\n{e}')
+    return {}
+
+def future_value(future, path, key=None):
+    """
+    Function waiting for a detected value, reporting errors as undetected values.
+    """
+    def value():
+        try:
+            result = future.result()
+            return result if key is None else result[key]
+        except Exception as e:
+            print(f'Could not process {path}:\n{e}')
+        return None
+    return value
+
+class TagDetector:
+    """
+    Pipeline detecting tag values of many streams concurrently. Audio samples are extracted
+    in a thread pool and fed into a single batched Whisper consumer, while subtitle languages
+    are detected in a process pool.
+    """
+    def __init__(self, tag, opts=None, audio_jobs=1, subtitle_jobs=1):
+        self.tag = tag
+        self.opts = { **DEF_OPTS_LANGUAGE, **(opts or {}) }
+        self.threads = concurrent.futures.ThreadPoolExecutor(max(1, audio_jobs))
+        self.subtitle_jobs = max(1, subtitle_jobs)
+        self.processes = None
+        self.processes_lock = threading.Lock()
+        self.batcher = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.threads.shutdown()
+        if self.processes:
+            self.processes.shutdown()
+        if self.batcher:
+            self.batcher.close()
+
+    def submit(self, media, streams):
+        """
+        Start detecting the tag values of the given streams of a media.
+        Returns a function per stream waiting for its value.
+        """
+        values = [None] * len(streams)
+        subtitles = []
+        for i, stream in enumerate(streams):
+            if self.tag != 'language':
+                values[i] = lambda stream=stream: tag_value(stream, self.tag, self.opts)
+            elif stream.has_cached_language(self.opts):
+                language = stream.detect_language(self.opts)
+                values[i] = lambda language=language: language
+            elif stream.is_audio():
+                if self.batcher is None:
+                    self.batcher = WhisperBatcher(self.opts)
+                values[i] = future_value(self.threads.submit(self.detect_audio, stream), media.path)
+            else:
+                subtitles.append(i)
+        if subtitles:
+            future = self.threads.submit(self.detect_subtitles, media, [streams[i] for i in subtitles])
+            for key, i in enumerate(subtitles):
+                values[i] = future_value(future, media.path, key)
+        return values
+
+    def detect_audio(self, stream):
+        try:
+            scores = stream.detect_audio_scores(self.opts, self.batcher.infer)
+            language = select_audio_language(scores, self.opts)
+        except Exception as e:
+            print(f'Could not process {stream.media.path}:\n{e}')
+            return None
+        stream.store_language(self.opts, language, scores)
+        return language
+
+    def detect_subtitles(self, media, streams):
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                sources = tag_sources(media, streams, self.tag, self.opts, tmp)
+            except Exception as e:
+                print(f'Could not process {media.path}:\n{e}')
+                sources = {}
+            futures = [self.submit_subtitle(media, stream, sources) for stream in streams]
+            languages = []
+            for stream, future in zip(streams, futures):
+                try:
+                    language = future.result() if future else None
+                except Exception as e:
+                    print(f'Could not process {media.path}:\n{e}')
+                    languages.append(None)
+                    continue
+                stream.store_language(self.opts, language)
+                languages.append(language)
+            return languages
+
+    def get_processes(self):
+        # Spawning interpreters is expensive, so only done once subtitles need detection
+        with self.processes_lock:
+            if self.processes is None:
+                self.processes = concurrent.futures.ProcessPoolExecutor(self.subtitle_jobs,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self.processes
+
+    def submit_subtitle(self, media, stream, sources):
+        try:
+            if not stream.is_text_subtitle():
+                return None
+            if media.ext == 'srt':
+                return self.get_processes().submit(srt_language, media.path)
+            if stream.index in sources:
+                return self.get_processes().submit(srt_language, sources[stream.index])
+            return self.get_processes().submit(srt_stream_language,
+                media.path, stream.index, stream.get_info()['codec_name'])
+        except Exception as e:
+            print(f'Could not process {media.path}:\n{e}')
+        return None
+
+def tag_streams(media, stype, tag, skip_tagged=False):
+    """
+    Select the streams of a media to be tagged, along with their current tag value.
+    """
+    streams = []
+    for stream in media.get_streams():
+        stream_info = stream.get_info()
+        if stream_info['codec_type'] not in ('audio', 'subtitle'):
+            continue
+        if stype != 'all' and stream_info['codec_type'] != stype:
+            continue
+        stream_value = stream_info['tags'].get(tag) or \
+                       stream_info['tags'].get(tag.lower()) or \
+                       stream_info['tags'].get(tag.upper())
+        if skip_tagged and stream_value is not None:
+            continue
+        streams.append((stream, stream_value))
+    return streams
+
+def find_mkvpropedit():
+    return find_executable('mkvpropedit', [
         'C:/Program Files/MKVToolNix/mkvpropedit.exe',
         'C:/Program Files (x86)/MKVToolNix/mkvpropedit.exe',
     ])
-    plan = TagPlan()
-    for m in media:
-        # Skip files with formats that do not support tagging
-        if m.is_format('subviewer'):
-            continue
 
-        for stream in m.get_streams():
-            # Filter streams and get old tag value
-            stream_info = stream.get_info()
-            if stream_info['codec_type'] not in ('audio', 'subtitle'):
-                continue
-            if stype != 'all' and stream_info['codec_type'] != stype:
-                continue
-            stream_value = stream_info['tags'].get(tag) or \
-                           stream_info['tags'].get(tag.lower()) or \
-                           stream_info['tags'].get(tag.upper())
-            if skip_tagged and stream_value is not None:
-                continue
+def plan_tag(media, stype, tag, value=None, skip_tagged=False, opts=None, audio_jobs=1, subtitle_jobs=1):
+    path_mkvpropedit = find_mkvpropedit()
+    plan = TagPlan()
 
+    def add_tasks(m, streams, values):
+        for (stream, stream_value), new_value in zip(streams, values):
             # Create tag update task
             task = TagTask(m)
             if m.is_format('avi'):
@@ -140,8 +334,27 @@ def plan_tag(media, stype, tag, value=None, skip_tagged=False, opts=None):
                 task.use_mkvpropedit = True
                 task.path_mkvpropedit = path_mkvpropedit
             old_value = stream_value
-            new_value = value if value is not None else tag_value(stream, tag, opts)
+            new_value = value if value is not None else new_value()
             if old_value != new_value and new_value is not None:
                 task.add_update(stream.index, tag, old_value, new_value)
                 plan.add_task(task)
+
+    # Detect values of several media concurrently, emitting tasks in input order
+    max_pending = 2 * max(audio_jobs, subtitle_jobs, 1)
+    pending = collections.deque()
+    with TagDetector(tag, opts, audio_jobs, subtitle_jobs) as detector:
+        for m in media:
+            # Skip files with formats that do not support tagging
+            if m.is_format('subviewer'):
+                continue
+            streams = tag_streams(m, stype, tag, skip_tagged)
+            if value is None:
+                values = detector.submit(m, [stream for stream, _ in streams])
+            else:
+                values = [None] * len(streams)
+            pending.append((m, streams, values))
+            while len(pending) > max_pending:
+                add_tasks(*pending.popleft())
+        while pending:
+            add_tasks(*pending.popleft())
     return plan
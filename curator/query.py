@@ -0,0 +1,142 @@
+import fractions
+import operator
+import re
+
+# Query syntax
+QUERY_BINARY = re.compile(r'^(?P<lhs>[^\s!=<>~]+)\s*(?P<op>!=|<=|>=|~=|==|=|<|>)\s*(?P<rhs>.*)$')
+QUERY_IN = re.compile(r'^(?P<lhs>[^\s!=<>~]+)\s+(?P<op>in)\s+(?P<rhs>.+)$')
+QUERY_EXISTS = re.compile(r'^(?P<op>!?)(?P<lhs>[^\s!=<>~]+)$')
+
+# Sentinel for missing keys
+MISSING = object()
+
+def parse_number(value):
+    """
+    Interpret strings such as `1920`, `0.5` or `24000/1001` as numbers, if possible.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(fractions.Fraction(value))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def compare(op):
+    def compare_values(lhs, rhs):
+        lhs_number = parse_number(lhs)
+        rhs_number = parse_number(rhs)
+        if lhs_number is not None and rhs_number is not None:
+            return op(lhs_number, rhs_number)
+        return op(str(lhs), rhs)
+    return compare_values
+
+# Operators, given the lhs value and the parsed rhs
+QUERY_OPERATORS = {
+    '=': lambda lhs, rhs: str(lhs) == rhs,
+    '==': lambda lhs, rhs: str(lhs) == rhs,
+    '!=': lambda lhs, rhs: str(lhs) != rhs,
+    '<': compare(operator.lt),
+    '<=': compare(operator.le),
+    '>': compare(operator.gt),
+    '>=': compare(operator.ge),
+    '~=': lambda lhs, rhs: rhs.search(str(lhs)) is not None,
+    'in': lambda lhs, rhs: str(lhs) in rhs,
+    '': lambda lhs, rhs: True,
+    '!': lambda lhs, rhs: True,
+}
+
+def flatten_info(info, prefix=''):
+    """
+    Yield (key, value) pairs of nested media/stream information, e.g. (`tags.language`, `eng`).
+    """
+    for key, value in info.items():
+        if isinstance(value, dict):
+            yield from flatten_info(value, f'{prefix}{key}.')
+        elif not isinstance(value, list):
+            yield f'{prefix}{key}', value
+
+class Query:
+    """
+    Compiled metadata filter. Supported syntax:
+    - `key=value`, `key!=value`: Equality/inequality.
+    - `key<value`, `key<=value`, `key>value`, `key>=value`: Numeric (or string) comparison.
+    - `key~=regex`: Regular expression search.
+    - `key in a,b,c`: Membership.
+    - `key`, `!key`: Existence/non-existence.
+    Keys are dot-separated paths into stream information, e.g. `tags.language`,
+    or into media information if prefixed by `format.`, e.g. `format.format_name`.
+    """
+    def __init__(self, query):
+        self.query = query
+        match = QUERY_BINARY.match(query) or QUERY_IN.match(query) or QUERY_EXISTS.match(query)
+        if not match:
+            raise ValueError(f"Invalid query: {query}")
+        self.op = match['op']
+        self.key = match['lhs']
+        rhs = match.groupdict().get('rhs')
+        if self.op == '~=':
+            rhs = re.compile(rhs)
+        elif self.op == 'in':
+            rhs = tuple(map(str.strip, rhs.split(',')))
+        self.rhs = rhs
+
+        # Split media-level from stream-level keys
+        path = self.key.split('.')
+        self.media_level = path[0] == 'format'
+        if self.media_level:
+            path = path[1:]
+            self.key = '.'.join(path)
+        self.path = path
+
+    def __repr__(self):
+        return f'Query("{self.query}")'
+
+    def lookup(self, info):
+        for key in self.path:
+            if not isinstance(info, dict) or key not in info:
+                return MISSING
+            info = info[key]
+        return info
+
+    def match(self, info):
+        lhs = self.lookup(info)
+        if self.op == '!':
+            return lhs is MISSING
+        if lhs is MISSING or lhs is None:
+            return False
+        return QUERY_OPERATORS[self.op](lhs, self.rhs)
+
+    def sql(self):
+        """
+        Condition over rows (path, stream, key, value, num) of flattened information
+        matching this query, as a SQL expression and its parameters.
+        Non-existence queries are handled by the caller.
+        """
+        op = self.op
+        if op in ('', '!'):
+            return 'key = ?', [self.key]
+        if op in ('=', '=='):
+            return 'key = ? AND value = ?', [self.key, self.rhs]
+        if op == '!=':
+            return 'key = ? AND value != ?', [self.key, self.rhs]
+        if op == '~=':
+            return 'key = ? AND value REGEXP ?', [self.key, self.rhs.pattern]
+        if op == 'in':
+            marks = ', '.join('?' * len(self.rhs))
+            return f'key = ? AND value IN ({marks})', [self.key, *self.rhs]
+        number = parse_number(self.rhs)
+        if number is None:
+            return f'key = ? AND value {op} ?', [self.key, self.rhs]
+        return f'key = ? AND ((num IS NOT NULL AND num {op} ?) OR (num IS NULL AND value {op} ?))', \
+            [self.key, number, self.rhs]
+
+def parse_query(query):
+    if isinstance(query, Query):
+        return query
+    return Query(query)
@@ -1,16 +1,23 @@
 import collections
+import concurrent.futures
 import fractions
-import json
 import logging
 import os
+import queue
 import re
 import subprocess
 import tempfile
+import threading
 
 import chardet
 import iso639
 import langid
-import pysrt
+import numpy as np
+
+from .cache import get_language_cache
+from .formats import avi
+from .packets import load_index, read_index
+from .vad import VAD_FRAME_RATE, read_envelope, select_speech_windows
 
 # Default options
 DEF_OPTS_LANGUAGE = {
@@ -18,8 +25,364 @@ DEF_OPTS_LANGUAGE = {
     'max_audio_samples': 10,
     'max_video_samples': 10,
     'min_score': 0.8,
+    'whisper_model': 'base',
+    'whisper_threads': None,
+    'whisper_batch_size': 16,
+    'adaptive_sampling': False,
+    'adaptive_confidence': 0.95,
+    'adaptive_min_samples': 3,
+    'vad': False,
 }
 
+# Subtitle codecs without text
+SUBTITLE_BITMAP_CODECS = ('dvb_subtitle', 'dvd_subtitle', 'hdmv_pgs_subtitle', 'xsub')
+
+# Subtitle sampling parameters
+SRT_ENCODING_PREFIX = 0x4000
+SRT_ENCODING_MAX = 0x40000
+SRT_ENCODING_CONFIDENCE = 0.7
+SRT_SAMPLES = 8
+SRT_SAMPLE_SIZE = 0x2000
+SRT_TEXT_BUDGET = 0x2000
+SRT_MARKUP = re.compile(r'<[^>]*>|\{[^}]*\}')
+
+# Whisper models loaded in this process
+whisper_models = {}
+whisper_models_lock = threading.Lock()
+
+def get_whisper_model(name='base', threads=None):
+    """
+    Load an OpenAI Whisper model, only once per process and model name.
+    Optionally, set the number of threads used by PyTorch on CPU.
+    """
+    with whisper_models_lock:
+        import torch
+        import whisper
+        if threads and torch.get_num_threads() != threads:
+            torch.set_num_threads(threads)
+        model = whisper_models.get(name)
+        if model is None:
+            logging.debug(f'Loading Whisper model "{name}"')
+            model = whisper.load_model(name)
+            whisper_models[name] = model
+        return model
+
+def detect_whisper_probs(windows, opts=DEF_OPTS_LANGUAGE):
+    """
+    Detect language probabilities of audio windows, running Whisper on batches of stacked
+    log-mel spectrograms. Returns a list with a dictionary of probabilities per window,
+    or None for windows where detection failed.
+    """
+    import torch
+    import whisper
+    model = get_whisper_model(opts['whisper_model'], opts['whisper_threads'])
+    def mel(audio):
+        return whisper.log_mel_spectrogram(whisper.pad_or_trim(audio))
+
+    probs = []
+    batch_size = max(1, opts['whisper_batch_size'])
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start:start + batch_size]
+        try:
+            mels = torch.stack(list(map(mel, batch))).to(model.device)
+            _, batch_probs = model.detect_language(mels)
+            probs += batch_probs
+            continue
+        except Exception as e:
+            logging.debug(f'Failed to detect language in batch of {len(batch)} samples, retrying individually:\n{e}')
+        # Isolate failing windows
+        for index, audio in enumerate(batch):
+            try:
+                _, window_probs = model.detect_language(mel(audio).to(model.device))
+                probs.append(window_probs)
+            except Exception as e:
+                logging.warning(f'Failed to detect language in sample #{start + index:02d}:\n{e}')
+                probs.append(None)
+    return probs
+
+class WhisperBatcher:
+    """
+    Single consumer running Whisper inference over windows submitted from multiple threads,
+    combining all pending requests into shared batches.
+    """
+    def __init__(self, opts=DEF_OPTS_LANGUAGE):
+        self.opts = { **DEF_OPTS_LANGUAGE, **opts }
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, windows):
+        future = concurrent.futures.Future()
+        self.queue.put((windows, future))
+        return future
+
+    def infer(self, windows):
+        return self.submit(windows).result()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        stop = False
+        while not stop:
+            request = self.queue.get()
+            if request is None:
+                break
+            requests = [request]
+            while not stop and sum(len(r[0]) for r in requests) < self.opts['whisper_batch_size']:
+                try:
+                    request = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                else:
+                    requests.append(request)
+            try:
+                probs = detect_whisper_probs([w for windows, _ in requests for w in windows], self.opts)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            for windows, future in requests:
+                future.set_result(probs[:len(windows)])
+                probs = probs[len(windows):]
+
+def whisper_language(lang):
+    """
+    Rename languages since OpenAI Whisper does not fully adhere to ISO 639-1.
+    """
+    replacements = { 'jw': 'jv' }
+    return replacements.get(lang, lang)
+
+def macrolanguage(lang):
+    """
+    ISO 639-3 macrolanguage of an ISO 639-1 language, or its ISO 639-3 code if none.
+    """
+    macro = iso639.Lang(pt1=lang).macro()
+    return macro.pt3 if macro else iso639.Lang(pt1=lang).pt3
+
+def collect_audio_votes(probs, opts=DEF_OPTS_LANGUAGE):
+    """
+    Group the probabilities of windows whose most likely language reaches the minimum score
+    by ISO 639-1 language. Returns the votes and the number of failed windows.
+    """
+    debug = logging.getLogger().level == logging.DEBUG
+    results = {}
+    err_samples = 0
+    for index, window_probs in enumerate(probs):
+        if window_probs is None:
+            err_samples += 1
+            continue
+        if debug:
+            highest_probs = dict(collections.Counter(window_probs).most_common(5))
+            highest_probs_rounded = { k: f'{v:.4f}' for k, v in highest_probs.items() }
+            logging.debug(f'Sample #{index:02d}: {highest_probs_rounded}')
+        lang = max(window_probs, key=window_probs.get)
+        prob = window_probs[lang]
+        if opts['min_score'] <= prob:
+            results.setdefault(whisper_language(lang), []).append(prob)
+    return results, err_samples
+
+def vote_audio_language(probs, opts=DEF_OPTS_LANGUAGE):
+    """
+    Compute scores of ISO 639-1 languages as votes+avg(prob) over windows whose most likely
+    language reaches the minimum score. Returns None if more than half of the windows failed.
+    """
+    results, err_samples = collect_audio_votes(probs, opts)
+
+    # Compute final scores as votes+avg(prob) if more than half succeeded
+    if err_samples > len(probs) / 2:
+        return None
+    return { k: len(v) + sum(v)/len(v) for k, v in results.items() }
+
+def audio_language_settled(probs, remaining, opts=DEF_OPTS_LANGUAGE):
+    """
+    Check whether the leading language can no longer be overtaken by the remaining windows,
+    or has been detected in enough windows with an average probability above the confidence.
+    """
+    results, _ = collect_audio_votes(probs, opts)
+    if not results:
+        return False
+
+    # Group votes by the language that would be selected
+    groups = {}
+    for lang, votes in results.items():
+        key = macrolanguage(lang) if opts['only_macrolanguages'] else lang
+        groups.setdefault(key, []).append(votes)
+    scores = { k: sum(len(v) + sum(v)/len(v) for v in group) for k, group in groups.items() }
+    leader = max(scores, key=scores.get)
+
+    # Confidence: a single language voted with high probability
+    leader_votes = [prob for votes in groups[leader] for prob in votes]
+    if len(groups) == 1 and len(leader_votes) >= opts['adaptive_min_samples'] \
+        and sum(leader_votes) / len(leader_votes) >= opts['adaptive_confidence']:
+        return True
+
+    # Bound: the leader score never decreases, while each remaining window adds at most
+    # one vote plus, for macrolanguages, the average of a newly voted member language
+    growth = 2 if opts['only_macrolanguages'] else 1
+    bounds = [remaining * growth + (1 if remaining else 0)]
+    for key, group in groups.items():
+        if key != leader:
+            bounds.append(sum(len(v) + 1 for v in group) + remaining * growth)
+    return scores[leader] > max(bounds)
+
+def select_audio_language(scores, opts=DEF_OPTS_LANGUAGE):
+    """
+    Select the ISO 639-3 language with the highest score.
+    """
+    if not scores:
+        return None
+
+    # Optionally merge into ISO 639-3 macrolanguages and return highest ocurring
+    if opts['only_macrolanguages']:
+        macro_results = {}
+        for key, value in scores.items():
+            lang = macrolanguage(key)
+            macro_results[lang] = macro_results.get(lang, 0) + value
+        lang = max(macro_results, key=macro_results.get)
+        return lang
+
+    # Get highest occurring language and convert ISO 639-1 to ISO 639-3
+    lang = max(scores, key=scores.get)
+    lang = iso639.Lang(pt1=lang).pt3
+    return lang
+
+def spread_order(count):
+    """
+    Order indices of evenly spaced windows so that every prefix covers the timeline,
+    starting from the middle and always picking the index farthest from those chosen.
+    """
+    if count == 0:
+        return []
+    order = [count // 2]
+    remaining = set(range(count)) - set(order)
+    while remaining:
+        index = max(sorted(remaining), key=lambda i: min(abs(i - j) for j in order))
+        order.append(index)
+        remaining.remove(index)
+    return order
+
+def detect_srt_encoding(f):
+    """
+    Detect the encoding of a subtitle file from a prefix, growing it while confidence is low.
+    """
+    size = SRT_ENCODING_PREFIX
+    while True:
+        f.seek(0)
+        data = f.read(size)
+        result = chardet.detect(data)
+        enc = result['encoding']
+        if len(data) < size or size >= SRT_ENCODING_MAX:
+            break
+        # ASCII prefixes say nothing about the remaining text
+        if enc not in (None, 'ascii') and result['confidence'] >= SRT_ENCODING_CONFIDENCE:
+            break
+        size *= 4
+    if enc in (None, 'ascii', 'Windows-1254'):
+        enc = 'utf-8' # Windows-1254 is often a false positive
+    return enc
+
+def sample_srt_text(f, encoding):
+    """
+    Read the text of cues from blocks spread across a subtitle file, up to a fixed budget.
+    """
+    size = f.seek(0, os.SEEK_END)
+    offsets = [0]
+    block = size
+    if size > SRT_SAMPLES * SRT_SAMPLE_SIZE:
+        block = SRT_SAMPLE_SIZE
+        offsets = [i * (size - block) // (SRT_SAMPLES - 1) for i in range(SRT_SAMPLES)]
+
+    # Align offsets to code units of wide encodings
+    unit = 4 if '32' in encoding else 2 if '16' in encoding else 1
+    budget = SRT_TEXT_BUDGET // len(offsets)
+    texts = []
+    for offset in offsets:
+        offset -= offset % unit
+        f.seek(offset)
+        data = f.read(block).decode(encoding, errors='replace')
+        cues = data.replace('\r\n', '\n').split('\n\n')
+        # Drop cues cut by the block boundaries
+        if offset > 0:
+            cues = cues[1:]
+        if offset + block < size:
+            cues = cues[:-1]
+        text = ''
+        for cue in cues:
+            lines = cue.strip('\n\ufeff').split('\n')
+            timing = next((i for i, line in enumerate(lines) if '-->' in line), None)
+            if timing is None:
+                continue
+            text += ' ' + ' '.join(SRT_MARKUP.sub('', line) for line in lines[timing + 1:])
+            if len(text) >= budget:
+                break
+        texts.append(text[:budget])
+    return ' '.join(texts)
+
+def srt_language(path):
+    """
+    Detect the ISO 639-3 language of a subtitle file from a bounded sample of its text.
+    """
+    with open(path, 'rb') as f:
+        enc = detect_srt_encoding(f)
+        text = sample_srt_text(f, enc)
+    lang = langid.classify(text)[0]
+    lang = iso639.Lang(pt1=lang).pt3
+    return lang
+
+def extract_srt(path, index, codec_name, output):
+    """
+    Extract a subtitle stream into an SRT file, copying it if already in SubRip format.
+    """
+    cmd = ['ffmpeg', '-i', path, '-map', f'0:{index}']
+    if codec_name in ('srt', 'subrip'):
+        cmd += ['-c:s', 'copy']
+    cmd += [output]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        errors = result.stderr.decode('utf-8')
+        raise Exception(f"Failed to extract subtitles from {path} with ffmpeg:\n{errors}")
+
+def srt_stream_language(path, index, codec_name):
+    """
+    Detect the ISO 639-3 language of a text subtitle stream, extracting it as SRT file.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'output.srt')
+        extract_srt(path, index, codec_name, output)
+        return srt_language(output)
+
+def detect_audio_scores(streams, opts=DEF_OPTS_LANGUAGE):
+    """
+    Compute language scores of multiple audio streams using OpenAI Whisper, running inference
+    over the windows of all streams in shared batches.
+    With adaptive sampling, streams are sampled one window at a time and stop early instead.
+    """
+    opts = { **DEF_OPTS_LANGUAGE, **opts }
+    if opts['adaptive_sampling']:
+        return [stream.detect_audio_scores_adaptive(opts) for stream in streams]
+    windows = []
+    for stream in streams:
+        assert(stream.is_audio())
+        logging.debug(f'Detecting audio language in stream #{stream.index} of media: "{stream.media.name}"')
+        windows.append(stream.sample_audio(opts))
+    probs = detect_whisper_probs([w for stream_windows in windows for w in stream_windows], opts)
+    scores = []
+    for stream_windows in windows:
+        stream_probs, probs = probs[:len(stream_windows)], probs[len(stream_windows):]
+        scores.append(vote_audio_language(stream_probs, opts))
+    return scores
+
+def detect_audio_languages(streams, opts=DEF_OPTS_LANGUAGE):
+    """
+    Detect languages of multiple audio streams using OpenAI Whisper.
+    """
+    opts = { **DEF_OPTS_LANGUAGE, **opts }
+    return [select_audio_language(scores, opts) for scores in detect_audio_scores(streams, opts)]
+
 class Stream:
     def __init__(self, media, index, info=None):
         self.media = media
@@ -27,6 +390,7 @@ class Stream:
 
         # Cache stream information
         self.info = info
+        self.type_indices = None
         self.frames = None
         self.packets = None
 
@@ -45,22 +409,42 @@ class Stream:
     def is_subtitle(self):
         return self.get_info()['codec_type'] == 'subtitle'
 
+    def is_text_subtitle(self):
+        return self.get_info()['codec_name'] not in SUBTITLE_BITMAP_CODECS
+
+    def type_index(self, codec_type):
+        """
+        Number of streams of the given type preceding this one in the parent media.
+        """
+        if self.type_indices is None:
+            streams = self.media.get_streams()[:self.index]
+            return len([s for s in streams if s.get_info()['codec_type'] == codec_type])
+        return self.type_indices.get(codec_type, 0)
+
     def video_index(self):
-        return len([s for s in self.media.get_streams()[:self.index] if s.is_video()])
+        return self.type_index('video')
 
     def audio_index(self):
-        return len([s for s in self.media.get_streams()[:self.index] if s.is_audio()])
+        return self.type_index('audio')
 
     def subtitle_index(self):
-        return len([s for s in self.media.get_streams()[:self.index] if s.is_subtitle()])
+        return self.type_index('subtitle')
 
     def has_packed_bframes(self):
-        packet = self.get_packet(0)
-        packet_offs = int(packet['pos'])
-        packet_size = int(packet['size'])
-        with open(self.media.path, 'rb') as f:
-            f.seek(packet_offs)
-            data = f.read(packet_size)
+        # Read first packet directly from AVI files, falling back to ffprobe otherwise
+        data = None
+        if self.media.is_format('avi'):
+            try:
+                data = avi.read_stream_chunk(self.media.path, self.index)
+            except Exception as e:
+                logging.debug(f'Failed to parse AVI chunks in {self.media.path}: {e}')
+        if data is None:
+            packet = self.get_packet(0)
+            packet_offs = int(packet['pos'])
+            packet_size = int(packet['size'])
+            with open(self.media.path, 'rb') as f:
+                f.seek(packet_offs)
+                data = f.read(packet_size)
         match1 = re.search(br'\x00\x00\x01\xB2DivX(\d+)b(\d+)p', data)
         match2 = re.search(br'\x00\x00\x01\xB2DivX(\d+)Build(\d+)p', data)
         if match1 or match2:
@@ -70,17 +454,8 @@ class Stream:
     def get_info(self):
         if self.info:
             return self.info
-        cmd = ['ffprobe', self.media.path]
-        cmd += ['-show_streams']
-        cmd += ['-select_streams', str(self.index)]
-        cmd += ['-of', 'json']
-        result = subprocess.run(cmd, capture_output=True)
-        if result.returncode != 0:
-            errors = result.stderr.decode('utf-8')
-            raise Exception(f"Failed to get info from {self} with ffmpeg:\n{errors}")
-        output = result.stdout.decode('utf-8')
-        self.info = json.loads(output)['streams']
-        self.info.setdefault('tags', {})
+        # Reuse the (possibly cached) probe of all streams in the parent media
+        self.info = self.media.get_streams()[self.index].get_info()
         return self.info
 
     def get_duration(self):
@@ -98,179 +473,171 @@ class Stream:
         return fractions.Fraction(self.get_info()['avg_frame_rate'])
 
     def get_frames(self):
-        if self.frames:
-            return self.frames
-        cmd = ['ffprobe', self.media.path]
-        cmd += ['-show_frames']
-        cmd += ['-select_streams', str(self.index)]
-        cmd += ['-of', 'json']
-        result = subprocess.run(cmd, capture_output=True)
-        if result.returncode != 0:
-            errors = result.stderr.decode('utf-8')
-            raise Exception(f"Failed to get frames from {self} with ffmpeg:\n{errors}")
-        output = result.stdout.decode('utf-8')
-        self.frames = json.loads(output)['frames']
+        if self.frames is None:
+            self.frames = load_index(self.media.path, self.index, 'frame')
         return self.frames
 
     def get_packets(self):
-        if self.packets:
-            return self.packets
-        cmd = ['ffprobe', self.media.path]
-        cmd += ['-show_packets']
-        cmd += ['-select_streams', str(self.index)]
-        cmd += ['-of', 'json']
-        result = subprocess.run(cmd, capture_output=True)
-        if result.returncode != 0:
-            errors = result.stderr.decode('utf-8')
-            raise Exception(f"Failed to get packets from {self} with ffmpeg:\n{errors}")
-        output = result.stdout.decode('utf-8')
-        self.packets = json.loads(output)['packets']
+        if self.packets is None:
+            self.packets = load_index(self.media.path, self.index, 'packet')
         return self.packets
 
     def get_packet(self, index):
-        if self.packets:
+        if self.packets is not None:
             return self.packets[index]
-        cmd = ['ffprobe', self.media.path]
-        cmd += ['-show_packets']
-        cmd += ['-select_streams', str(self.index)]
-        cmd += ['-read_intervals', f'%+#{index+1}']
-        cmd += ['-of', 'json']
+        packets = read_index(self.media.path, self.index, 'packet', f'%+#{index+1}')
+        return packets[index]
+
+    def extract_audio_samples(self, offsets, length, sample_rate=16000):
+        """
+        Decode windows of `length` seconds starting at the given offsets into mono float32
+        PCM arrays, using a single ffmpeg process with input-side seeking and no temporary files.
+        Windows are padded with silence if the stream ends before them.
+        """
+        if not offsets:
+            return []
+        num_frames = int(length * sample_rate)
+        cmd = ['ffmpeg', '-nostdin']
+        for offset in offsets:
+            cmd += ['-ss', f'{offset:.3f}', '-t', f'{length:.3f}', '-i', self.media.path]
+        filters = []
+        for index in range(len(offsets)):
+            filters.append(f'[{index}:{self.index}]' +
+                f'aformat=sample_fmts=flt:sample_rates={sample_rate}:channel_layouts=mono,' +
+                f'apad=whole_len={num_frames},atrim=end_sample={num_frames}[a{index}]')
+        labels = ''.join(f'[a{index}]' for index in range(len(offsets)))
+        filters.append(f'{labels}concat=n={len(offsets)}:v=0:a=1[out]')
+        cmd += ['-filter_complex', ';'.join(filters)]
+        cmd += ['-map', '[out]']
+        cmd += ['-f', 'f32le', 'pipe:1']
         result = subprocess.run(cmd, capture_output=True)
         if result.returncode != 0:
             errors = result.stderr.decode('utf-8')
-            raise Exception(f"Failed to get packets from {self} with ffmpeg:\n{errors}")
-        output = result.stdout.decode('utf-8')
-        packet = json.loads(output)['packets'][index]
-        return packet
+            raise Exception(f"Failed to extract audio samples from {self.media.path} with ffmpeg:\n{errors}")
+        audio = np.frombuffer(result.stdout, dtype=np.float32).copy()
+        return [audio[i * num_frames:(i + 1) * num_frames] for i in range(len(offsets))]
 
-    def detect_language(self, opts=DEF_OPTS_LANGUAGE):
-        opts = DEF_OPTS_LANGUAGE if opts is None else opts
+    def detect_language(self, opts=DEF_OPTS_LANGUAGE, source=None):
+        opts = DEF_OPTS_LANGUAGE if opts is None else { **DEF_OPTS_LANGUAGE, **opts }
         codec_type = self.get_info()['codec_type']
+        if codec_type not in ('audio', 'subtitle'):
+            return None
+
+        # Reuse results of previous detections over the same stream and options
+        cache = get_language_cache()
+        if cache:
+            entry = cache.get(self, opts)
+            if entry is not None:
+                return entry['language']
+        scores = None
         if codec_type == 'audio':
-            return self.detect_audio_language(opts)
+            scores = detect_audio_scores([self], opts)[0]
+            language = select_audio_language(scores, opts)
         if codec_type == 'subtitle':
-            return self.detect_subtitle_language(opts)
+            language = self.detect_subtitle_language(opts, source)
+        self.store_language(opts, language, scores)
+        return language
+
+    def has_cached_language(self, opts=DEF_OPTS_LANGUAGE):
+        cache = get_language_cache()
+        if not cache:
+            return False
+        opts = DEF_OPTS_LANGUAGE if opts is None else { **DEF_OPTS_LANGUAGE, **opts }
+        return cache.get(self, opts) is not None
+
+    def store_language(self, opts, language, scores=None):
+        cache = get_language_cache()
+        if cache:
+            opts = DEF_OPTS_LANGUAGE if opts is None else { **DEF_OPTS_LANGUAGE, **opts }
+            cache.put(self, opts, language, scores)
+
+    def audio_sample_offsets(self, opts=DEF_OPTS_LANGUAGE):
+        """
+        Offsets of evenly spaced windows of Whisper's chunk length in an audio stream.
+        Optionally, pick the most speech-dense window around each of them with an energy-based VAD.
+        """
+        from whisper.audio import CHUNK_LENGTH
+        if opts.get('vad'):
+            envelope = read_envelope(self.media.path, self.index)
+            duration = len(envelope) / VAD_FRAME_RATE
+            num_samples = min(opts['max_audio_samples'], int(duration / CHUNK_LENGTH))
+            offsets = select_speech_windows(envelope, CHUNK_LENGTH, num_samples)
+            logging.debug(f'Selected {len(offsets)} of {num_samples} audio samples with speech in stream #{self.index}')
+            return offsets
+        duration = self.get_duration()
+        num_samples = min(opts['max_audio_samples'], int(duration / CHUNK_LENGTH))
+        return [index * duration / num_samples for index in range(num_samples)]
+
+    def sample_audio(self, opts=DEF_OPTS_LANGUAGE):
+        """
+        Extract evenly spaced windows of Whisper's chunk length from an audio stream.
+        """
+        from whisper.audio import CHUNK_LENGTH, SAMPLE_RATE
+        offsets = self.audio_sample_offsets(opts)
+        return self.extract_audio_samples(offsets, float(CHUNK_LENGTH), SAMPLE_RATE)
 
     def detect_audio_language(self, opts=DEF_OPTS_LANGUAGE):
         """
         Detect language of an audio stream using OpenAI Whisper.
         """
+        return detect_audio_languages([self], opts)[0]
+
+    def detect_audio_scores(self, opts=DEF_OPTS_LANGUAGE, infer=None):
+        """
+        Compute language scores of an audio stream using OpenAI Whisper.
+        Optionally, run inference through the given function, e.g. a shared `WhisperBatcher`.
+        """
+        opts = { **DEF_OPTS_LANGUAGE, **opts }
+        if opts['adaptive_sampling']:
+            return self.detect_audio_scores_adaptive(opts, infer)
+        if infer is None:
+            return detect_audio_scores([self], opts)[0]
         assert(self.is_audio())
-        debug = logging.getLogger().level == logging.DEBUG
         logging.debug(f'Detecting audio language in stream #{self.index} of media: "{self.media.name}"')
+        return vote_audio_language(infer(self.sample_audio(opts)), opts)
 
-        import whisper
-        from whisper.audio import CHUNK_LENGTH
-        model = whisper.load_model("base")
-
-        # Calculate number of samples
-        duration = self.get_duration()
-        len_samples = float(CHUNK_LENGTH)
-        num_samples = min(opts['max_audio_samples'], int(duration / len_samples))
-
-        results = {}
-        with tempfile.TemporaryDirectory() as tmp:
-            ext = self.media.ext
-            err_samples = 0
-            for index in range(num_samples):
-                # Extract sample
-                sample = os.path.join(tmp, f'sample{index:04d}.{ext}')
-                cmd = ['ffmpeg', '-i', self.media.path, '-map', f'0:{self.index}']
-                cmd += ['-c:a', 'copy']
-                cmd += ['-ss', str(index * duration / num_samples)]
-                cmd += ['-t', str(len_samples)]
-                cmd += [sample]
-                result = subprocess.run(cmd, capture_output=True)
-                if result.returncode != 0:
-                    errors = result.stderr.decode('utf-8')
-                    raise Exception(f"Failed to extract audio sample from {self.media.path} with ffmpeg:\n{errors}")
-
-                # Detect language in sample
-                try:
-                    audio = whisper.load_audio(sample)
-                    audio = whisper.pad_or_trim(audio)
-                    mel = whisper.log_mel_spectrogram(audio).to(model.device)
-                    _, probs = model.detect_language(mel)
-                except Exception as e:
-                    logging.warning(f'Failed to detect language in {sample}:\n{e}')
-                    err_samples += 1
-                    continue
-                # Process language detection results
-                if debug:
-                    highest_probs = dict(collections.Counter(probs).most_common(5))
-                    highest_probs_rounded = { k: f'{v:.4f}' for k, v in highest_probs.items() }
-                    logging.debug(f'Sample #{index:02d}: {highest_probs_rounded}')
-                lang = max(probs, key=probs.get)
-                prob = probs[lang]
-                if opts['min_score'] <= prob:
-                    results.setdefault(lang, []).append(prob)
-
-        # Compute final scores as votes+avg(prob) if more than half succeeded
-        if err_samples > num_samples / 2:
-            return None
-        results = { k: len(v) + sum(v)/len(v) for k, v in results.items() }
-        if not results:
-            return None
-
-        # Rename keys since OpenAI Whisper does not fully adhere to ISO 639-1
-        replacements = [('jw', 'jv')]
-        for old, new in replacements:
-            if old in results:
-                results[new] = results.pop(old)
-
-        # Optionally merge into ISO 639-3 macrolanguages and return highest ocurring
-        if opts['only_macrolanguages']:
-            macro_results = {}
-            for key, value in results.items():
-                part3 = iso639.Lang(pt1=key).pt3
-                macro = iso639.Lang(pt1=key).macro()
-                lang = macro.pt3 if macro else part3
-                macro_results[lang] = macro_results.get(lang, 0) + value
-            lang = max(macro_results, key=macro_results.get)
-            return lang
-
-        # Get highest occurring language and convert ISO 639-1 to ISO 639-3
-        lang = max(results, key=results.get)
-        lang = iso639.Lang(pt1=lang).pt3
-        return lang
-
-    def detect_subtitle_language(self, opts=DEF_OPTS_LANGUAGE):
+    def detect_audio_scores_adaptive(self, opts=DEF_OPTS_LANGUAGE, infer=None):
+        """
+        Compute language scores of an audio stream using OpenAI Whisper, sampling windows spread
+        across the timeline one at a time and stopping once the result is settled.
+        """
+        from whisper.audio import CHUNK_LENGTH, SAMPLE_RATE
+        opts = { **DEF_OPTS_LANGUAGE, **opts }
+        if infer is None:
+            infer = lambda windows: detect_whisper_probs(windows, opts)
+        assert(self.is_audio())
+        logging.debug(f'Detecting audio language in stream #{self.index} of media: "{self.media.name}"')
+        offsets = self.audio_sample_offsets(opts)
+        offsets = [offsets[i] for i in spread_order(len(offsets))]
+        probs = []
+        while len(probs) < len(offsets):
+            count = max(opts['adaptive_min_samples'], 1) if not probs else 1
+            batch = offsets[len(probs):len(probs) + count]
+            windows = self.extract_audio_samples(batch, float(CHUNK_LENGTH), SAMPLE_RATE)
+            probs += infer(windows)
+            if audio_language_settled(probs, len(offsets) - len(probs), opts):
+                break
+        logging.debug(f'Used {len(probs)} of {len(offsets)} audio samples in stream #{self.index} of media: "{self.media.name}"')
+        return vote_audio_language(probs, opts)
+
+    def detect_subtitle_language(self, opts=DEF_OPTS_LANGUAGE, source=None):
         """
         Detect subtitle language copying/converting to SRT,
         extracting the raw text and detecting its language.
+        Optionally, reuse an SRT file already extracted from this stream as source.
         """
         assert(self.is_subtitle())
 
         # Cannot detect language in bitmap subtitles
-        if self.get_info()['codec_name'] == 'hdmv_pgs_subtitle':
+        if not self.is_text_subtitle():
             return None
 
-        # Detect subtitle language
-        def srt_language(path):
-            with open(path, 'rb') as f:
-                enc = chardet.detect(f.read())['encoding']
-            if enc == 'Windows-1254':
-                enc = None # Often false positive, let PySRT auto-detect
-            subs = pysrt.open(path, encoding=enc)
-            text = ' '.join(map(lambda x: x.text, subs))
-            lang = langid.classify(text)[0]
-            lang = iso639.Lang(pt1=lang).pt3
-            return lang
-
-        # Check if the parent media is already an SRT file
+        # Check if the parent media is already an SRT file, or the stream was extracted
         path = self.media.path
         if self.media.ext == 'srt':
             return srt_language(path)
+        if source is not None:
+            return srt_language(source)
 
         # Otherwise extract subtitle stream, converting to SRT
-        with tempfile.TemporaryDirectory() as tmp:
-            output = os.path.join(tmp, 'output.srt')
-            cmd = ['ffmpeg', '-i', path, '-map', f'0:{self.index}']
-            if self.get_info()['codec_name'] in ('srt', 'subrip'):
-                cmd += ['-c:s', 'copy']
-            cmd += [output]
-            result = subprocess.run(cmd, capture_output=True)
-            if result.returncode != 0:
-                errors = result.stderr.decode('utf-8')
-                raise Exception(f"Failed to extract subtitles from {path} with ffmpeg:\n{errors}")
-            return srt_language(output)
+        return srt_stream_language(path, self.index, self.get_info()['codec_name'])
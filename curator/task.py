@@ -1,3 +1,5 @@
+from .journal import get_journal
+
 class Task:
     def __init__(self, inputs=[], outputs=[]):
         self.inputs = inputs
@@ -22,6 +24,20 @@ class Task:
         self.warnings |= other.warnings
         self.errors |= other.errors
 
+    def commit(self):
+        """
+        Record that the outputs are complete, right before moving them into place,
+        so resuming interrupted plans does not remove them as partial outputs.
+        """
+        if journal := get_journal():
+            journal.commit(self)
+
+    def required_space(self):
+        """
+        Estimated bytes written by this task, as (directory, size) pairs.
+        """
+        return []
+
     def concat(self, other):
         assert(self.outputs == self.inputs)
         raise Exception("Unimplemented")
@@ -33,16 +49,13 @@ class Task:
                 yield stream
 
     def input_video_streams(self):
-        for stream in self.input_streams():
-            if stream.is_video():
-                yield stream
+        for media in self.inputs:
+            yield from media.video_streams
 
     def input_audio_streams(self):
-        for stream in self.input_streams():
-            if stream.is_audio():
-                yield stream
+        for media in self.inputs:
+            yield from media.audio_streams
 
     def input_subtitle_streams(self):
-        for stream in self.input_streams():
-            if stream.is_subtitle():
-                yield stream
+        for media in self.inputs:
+            yield from media.subtitle_streams
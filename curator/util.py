@@ -1,6 +1,8 @@
 import os
 import shutil
+import subprocess
 import sys
+import tempfile
 
 from collections.abc import Iterable
 
@@ -40,3 +42,61 @@ def find_executable(name, hints=[]):
         if os.path.exists(hint):
             return hint
     return None
+
+def run_pipeline(cmds):
+    """
+    Run commands connecting the standard output of each one to the standard input of the next.
+    Returns the return code and standard error output of each command.
+    """
+    procs = []
+    stderrs = [tempfile.TemporaryFile() for _ in cmds]
+    try:
+        stdin = None
+        for index, cmd in enumerate(cmds):
+            stdout = subprocess.PIPE if index < len(cmds) - 1 else subprocess.DEVNULL
+            proc = subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderrs[index])
+            # Let the previous command receive SIGPIPE if this one exits early
+            if stdin is not None:
+                stdin.close()
+            stdin = proc.stdout
+            procs.append(proc)
+        results = []
+        for proc, stderr in zip(procs, stderrs):
+            proc.wait()
+            stderr.seek(0)
+            results.append((proc.returncode, stderr.read().decode('utf-8')))
+        return results
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        for stderr in stderrs:
+            stderr.close()
+
+# Temporary directories next to outputs, named after the process owning them
+TEMP_PREFIX = '.temp-curator-'
+
+def temp_directory(directory):
+    return tempfile.TemporaryDirectory(dir=directory, prefix=f'{TEMP_PREFIX}{os.getpid()}-')
+
+def process_alive(pid):
+    """
+    Whether a process with the given ID is currently running.
+    """
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259 # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,76 @@
+import subprocess
+import tempfile
+
+import numpy as np
+
+# Envelope parameters
+VAD_SAMPLE_RATE = 8000
+VAD_FRAME_RATE = 100
+VAD_BAND = (300, 3400)
+
+# Speech decision parameters
+VAD_FLOOR_PERCENTILE = 10
+VAD_MARGIN_DB = 12
+VAD_MIN_SPEECH = 0.2
+
+def read_envelope(path, stream_index, sample_rate=VAD_SAMPLE_RATE, frame_rate=VAD_FRAME_RATE):
+    """
+    Decode an audio stream in a single streaming ffmpeg pass into a band-passed, downsampled
+    mono signal, and reduce it into the mean energy of each frame without retaining the samples.
+    """
+    frame_size = sample_rate // frame_rate
+    block_size = frame_size * frame_rate * 60
+    cmd = ['ffmpeg', '-nostdin']
+    cmd += ['-i', path]
+    cmd += ['-map', f'0:{stream_index}']
+    cmd += ['-af', f'aresample={sample_rate},' +
+        f'aformat=sample_fmts=flt:sample_rates={sample_rate}:channel_layouts=mono,' +
+        f'highpass=f={VAD_BAND[0]},lowpass=f={VAD_BAND[1]}']
+    cmd += ['-f', 'f32le', 'pipe:1']
+    chunks = []
+    with tempfile.TemporaryFile() as stderr:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr) as proc:
+            while data := proc.stdout.read(block_size * 4):
+                samples = np.frombuffer(data, dtype=np.float32)
+                samples = samples[:len(samples) - len(samples) % frame_size]
+                chunks.append(np.mean(np.square(samples.reshape(-1, frame_size)), axis=1))
+        if proc.returncode != 0:
+            stderr.seek(0)
+            errors = stderr.read().decode('utf-8')
+            raise Exception(f"Failed to get audio envelope from {path} with ffmpeg:\n{errors}")
+    if not chunks:
+        return np.empty(0, dtype=np.float32)
+    return np.concatenate(chunks)
+
+def speech_frames(envelope):
+    """
+    Classify frames as speech if their energy exceeds the noise floor by a fixed margin.
+    """
+    energy = 10 * np.log10(envelope + 1e-10)
+    floor = np.percentile(energy, VAD_FLOOR_PERCENTILE)
+    return energy > floor + VAD_MARGIN_DB
+
+def select_speech_windows(envelope, length, count, frame_rate=VAD_FRAME_RATE):
+    """
+    Offsets of up to `count` windows of `length` seconds, picking the window with the highest
+    fraction of speech frames within each of `count` equal segments of the timeline, without overlaps.
+    Windows with too little speech are skipped, unless no window qualifies.
+    """
+    window = int(length * frame_rate)
+    if count <= 0 or len(envelope) < window:
+        return []
+    speech = speech_frames(envelope).astype(np.int64)
+    speech_sum = np.concatenate(([0], np.cumsum(speech)))
+    density = (speech_sum[window:] - speech_sum[:-window]) / window
+    bounds = np.linspace(0, len(density), count + 1).astype(np.int64)
+    starts = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        # Avoid overlapping the window picked in the previous segment
+        if starts:
+            start = max(start, starts[-1] + window)
+        if end > start:
+            starts.append(int(start) + int(np.argmax(density[start:end])))
+    selected = [start for start in starts if density[start] >= VAD_MIN_SPEECH]
+    if not selected:
+        selected = [max(starts, key=lambda start: density[start])]
+    return [start / frame_rate for start in selected]
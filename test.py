@@ -8,6 +8,15 @@ from tests import *
 
 def test():
     test_analysis()
+    test_cache()
+    test_convert()
+    test_formats()
+    test_fuse()
+    test_journal()
+    test_media()
+    test_packets()
+    test_plan()
+    test_query()
     test_stream()
     print('All tests passed successfully.')
 
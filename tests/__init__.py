@@ -6,4 +6,13 @@ Curator.
 
 # Imports
 from .tests_analysis import *
+from .tests_cache import *
+from .tests_convert import *
+from .tests_formats import *
+from .tests_fuse import *
+from .tests_journal import *
+from .tests_media import *
+from .tests_packets import *
+from .tests_plan import *
+from .tests_query import *
 from .tests_stream import *
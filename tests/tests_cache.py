@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import contextlib
+import importlib
+import os
+import shutil
+import tempfile
+
+from curator.cache import LanguageCache, ProbeCache, get_language_cache, set_language_cache
+from curator.media import Media
+from curator.stream import DEF_OPTS_LANGUAGE, Stream
+
+# Module namespace, since the package only re-exports its contents
+stream_module = importlib.import_module('curator.stream')
+
+@contextlib.contextmanager
+def cache_sample(cls):
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['XDG_CACHE_HOME'] = os.path.join(tmp, 'cache')
+        try:
+            cache = cls()
+        finally:
+            if cache_home is None:
+                os.environ.pop('XDG_CACHE_HOME')
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache_home
+        try:
+            yield cache, tmp
+        finally:
+            cache.conn.close()
+
+def audio_stream(path, channels=2):
+    m = Media(path, Media.TYPE_FILE)
+    m.info = { 'format_name': 'matroska,webm', 'tags': {} }
+    info = { 'index': 0, 'codec_type': 'audio', 'codec_name': 'aac', 'channels': channels, 'tags': {} }
+    m.load_streams([Stream(m, 0, info)])
+    return m.streams[0]
+
+def touch(path, delta_ns):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + delta_ns))
+
+def test_probe_cache_identity():
+    with cache_sample(ProbeCache) as (cache, tmp):
+        path = os.path.join(tmp, 'a.mkv')
+        with open(path, 'wb') as f:
+            f.write(b'video')
+        probe = { 'format': { 'format_name': 'matroska,webm' }, 'streams': [] }
+        cache.put(path, 'probe', probe)
+        assert(cache.get(path, 'probe') == probe)
+
+        # Entries are invalidated by changes of mtime, size or inode
+        touch(path, 1000)
+        assert(cache.get(path, 'probe') is None)
+        cache.put(path, 'probe', probe)
+        with open(path, 'ab') as f:
+            f.write(b'!')
+        assert(cache.get(path, 'probe') is None)
+        cache.put(path, 'probe', probe)
+        st = os.stat(path)
+        shutil.copy2(path, path + '.new')
+        os.replace(path + '.new', path)
+        assert(os.stat(path).st_mtime_ns == st.st_mtime_ns and os.stat(path).st_size == st.st_size)
+        assert(cache.get(path, 'probe') is None)
+
+        # Refreshing caches ignore existing entries
+        cache.put(path, 'probe', probe)
+        cache.refresh = True
+        assert(cache.get(path, 'probe') is None)
+
+def test_language_cache_invalidation():
+    with cache_sample(LanguageCache) as (cache, tmp):
+        path = os.path.join(tmp, 'a.mka')
+        with open(path, 'wb') as f:
+            f.write(b'audio')
+        opts = { **DEF_OPTS_LANGUAGE }
+        previous_cache = get_language_cache()
+        detect_audio_scores = stream_module.detect_audio_scores
+        set_language_cache(cache)
+        try:
+            # Cached languages skip detection
+            def fail(streams, opts):
+                raise AssertionError('Unexpected detection')
+            stream_module.detect_audio_scores = fail
+            stream = audio_stream(path)
+            stream.store_language(opts, 'jpn', { 'ja': 1.9 })
+            assert(stream.has_cached_language(opts))
+            assert(stream.detect_language(opts) == 'jpn')
+
+            # Entries are invalidated by changes of options relevant to the stream type
+            assert(not cache.get(stream, { **opts, 'min_score': 0.5 }))
+            assert(cache.get(stream, { **opts, 'whisper_batch_size': 4 }))
+
+            # Or of codec parameters
+            assert(not cache.get(audio_stream(path, channels=6), opts))
+
+            # Or of the file identity
+            touch(path, 1000)
+            assert(not cache.get(stream, opts))
+            stream.store_language(opts, 'jpn')
+            with open(path, 'ab') as f:
+                f.write(b'!')
+            assert(not cache.get(stream, opts))
+        finally:
+            stream_module.detect_audio_scores = detect_audio_scores
+            set_language_cache(previous_cache)
+
+def test_cache():
+    test_probe_cache_identity()
+    test_language_cache_invalidation()
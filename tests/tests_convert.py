@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+from curator.media import Media
+from curator.plans.convert import ConvertTask
+
+def bframes_task(tmp):
+    input = Media(os.path.join(tmp, 'sample.avi'), Media.TYPE_FILE)
+    output = Media(os.path.join(tmp, 'sample.mkv'), Media.TYPE_FILE)
+    task = ConvertTask(input, output, 'mkv')
+    task.unpack_bframes = True
+    task.add_fflag('+genpts')
+    return task
+
+def test_convert_unpack_commands():
+    with tempfile.TemporaryDirectory() as tmp:
+        task = bframes_task(tmp)
+        assert(task.needs_unpacking())
+
+        # Unpacked streams are piped as AVI, which accepts packets without PTS
+        cmd = task.unpack_command()
+        assert(cmd[-3:] == ['-f', 'avi', 'pipe:1'])
+        assert(cmd[cmd.index('-bsf:v') + 1] == 'mpeg4_unpack_bframes')
+        assert(task.input_args() == ['-fflags', '+genpts', '-f', 'avi', '-i', 'pipe:0'])
+        assert('-bsf:v' not in task.codec_args())
+
+def test_convert_unpack_pipeline():
+    if not shutil.which('ffmpeg'):
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        task = bframes_task(tmp)
+        cmd = ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=duration=2:size=160x120:rate=25']
+        cmd += ['-f', 'lavfi', '-i', 'sine=duration=2']
+        cmd += ['-c:v', 'mpeg4', '-bf', '2', '-vtag', 'DX50', '-c:a', 'mp2']
+        cmd += [task.inputs[0].path]
+        subprocess.run(cmd, capture_output=True, check=True)
+
+        # Both stages succeed on B-frames stored without PTS
+        cmd = ['ffmpeg'] + task.input_args() + task.codec_args() + ['-map', '0']
+        cmd += [task.outputs[0].path]
+        code, errors = task.run(cmd)
+        assert(code == 0)
+        assert(os.path.getsize(task.outputs[0].path) > 0)
+
+def test_convert():
+    test_convert_unpack_commands()
+    test_convert_unpack_pipeline()
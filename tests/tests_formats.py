@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import struct
+import tempfile
+
+from curator.cache import ProbeCache, get_probe_cache, set_probe_cache
+from curator.formats import avi, matroska, mp4
+from curator.media import Media, filter_cached
+from curator.query import parse_query
+
+def riff_chunk(fourcc, data):
+    pad = b'\x00' if len(data) & 1 else b''
+    return struct.pack('<4sI', fourcc, len(data)) + data + pad
+
+def riff_list(form, chunks):
+    return riff_chunk(b'LIST', form + b''.join(chunks))
+
+def riff_avi(chunks):
+    data = b'AVI ' + b''.join(chunks)
+    return struct.pack('<4sI', b'RIFF', len(data)) + data
+
+def test_avi_read_stream_chunk():
+    packet = b'\x00\x00\x01\xB2DivX503b1393p'
+    data = riff_avi([
+        riff_list(b'hdrl', [riff_chunk(b'avih', bytes(56))]),
+        riff_chunk(b'JUNK', bytes(13)),
+        riff_list(b'movi', [
+            riff_chunk(b'01wb', b'audio'),
+            riff_chunk(b'00dc', b''),
+            riff_list(b'rec ', [riff_chunk(b'00dc', packet)]),
+            riff_chunk(b'00dc', b'second'),
+        ]),
+    ])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.avi')
+        with open(path, 'wb') as f:
+            f.write(data)
+        assert(avi.read_stream_chunk(path, 0) == packet)
+        assert(avi.read_stream_chunk(path, 1) == b'audio')
+        assert(avi.read_stream_chunk(path, 2) is None)
+
+def test_avi_write_info_tags():
+    hdrl = riff_list(b'hdrl', [riff_chunk(b'avih', bytes(56))])
+    movi = riff_list(b'movi', [riff_chunk(b'00dc', b'video')])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.avi')
+        read_info = lambda: open(path, 'rb').read()[len(hdrl) + 12:-len(movi)]
+
+        # Values are rewritten within their chunks, or grow into the following JUNK chunk
+        with open(path, 'wb') as f:
+            f.write(riff_avi([hdrl,
+                riff_list(b'INFO', [riff_chunk(b'IAS1', b'english\x00')]),
+                riff_chunk(b'JUNK', bytes(64)), movi]))
+        size = os.path.getsize(path)
+        data = open(path, 'rb').read()
+        assert(avi.write_info_tags(path, { 'IAS1': 'jpn' }, dry_run=True))
+        assert(open(path, 'rb').read() == data)
+        assert(avi.write_info_tags(path, { 'IAS1': 'jpn' }))
+        assert(read_info() == riff_list(b'INFO', [riff_chunk(b'IAS1', b'jpn\x00\x00\x00\x00\x00')]) +
+            riff_chunk(b'JUNK', bytes(64)))
+        assert(avi.write_info_tags(path, { 'IAS2': 'eng' }))
+        assert(read_info() == riff_list(b'INFO', [
+            riff_chunk(b'IAS1', b'jpn\x00\x00\x00\x00\x00'), riff_chunk(b'IAS2', b'eng\x00')]) +
+            riff_chunk(b'JUNK', bytes(52)))
+        assert(os.path.getsize(path) == size)
+
+        # Missing INFO lists are created in JUNK chunks, otherwise the file is left untouched
+        with open(path, 'wb') as f:
+            f.write(riff_avi([hdrl, riff_chunk(b'JUNK', bytes(24)), movi]))
+        assert(avi.write_info_tags(path, { 'IAS1': 'spa' }))
+        assert(read_info() == riff_list(b'INFO', [riff_chunk(b'IAS1', b'spa\x00')]) + riff_chunk(b'JUNK', b''))
+        assert(not avi.write_info_tags(path, { 'IAS1': 'spanish' }, dry_run=True))
+        assert(not avi.write_info_tags(path, { 'IAS1': 'spanish' }))
+        assert(read_info() == riff_list(b'INFO', [riff_chunk(b'IAS1', b'spa\x00')]) + riff_chunk(b'JUNK', b''))
+
+def mp4_box(kind, data):
+    if isinstance(data, list):
+        data = b''.join(data)
+    return struct.pack('>I4s', len(data) + 8, kind) + data
+
+def mp4_trak(version, language, extended=None):
+    if version == 1:
+        mdhd = struct.pack('>B3xQQIQ', 1, 0, 0, 1000, 0)
+    else:
+        mdhd = struct.pack('>B3xIIII', 0, 0, 0, 1000, 0)
+    mdhd += struct.pack('>HH', mp4.pack_language(language), 0)
+    boxes = [mp4_box(b'mdhd', mdhd), mp4_box(b'hdlr', bytes(24))]
+    if extended:
+        boxes.append(mp4_box(b'elng', bytes(4) + extended.encode() + b'\x00'))
+    return mp4_box(b'trak', [mp4_box(b'tkhd', bytes(84)), mp4_box(b'mdia', boxes)])
+
+def test_mp4_write_track_languages():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.mp4')
+        moov = mp4_box(b'moov', [mp4_box(b'mvhd', bytes(100)),
+            mp4_trak(0, 'und'), mp4_trak(1, 'und', 'en-US')])
+        with open(path, 'wb') as f:
+            f.write(mp4_box(b'ftyp', b'isom') + moov + mp4_box(b'mdat', bytes(16)))
+        data = open(path, 'rb').read()
+        assert(mp4.write_track_languages(path, { 0: 'jpn', 1: 'eng' }, dry_run=True))
+        assert(not mp4.write_track_languages(path, { 0: 'en' }, dry_run=True))
+        assert(open(path, 'rb').read() == data)
+        assert(mp4.write_track_languages(path, { 0: 'jpn', 1: 'eng' }))
+        with open(path, 'rb') as f:
+            tracks = mp4.read_tracks(f)
+            languages = []
+            for track, offset in zip(tracks, (20, 32)):
+                f.seek(track[b'mdhd'][1] + offset)
+                languages.append(struct.unpack('>H', f.read(2))[0])
+        assert(languages == [mp4.pack_language('jpn'), mp4.pack_language('eng')])
+        assert(b'elng' not in tracks[1] and b'free' in tracks[1])
+        assert(mp4.pack_language('en') is None)
+        assert(not mp4.write_track_languages(path, { 0: 'en' }))
+        assert(not mp4.write_track_languages(path, { 2: 'eng' }))
+
+def ebml_element(eid, data):
+    if isinstance(data, int):
+        data = data.to_bytes(max(1, (data.bit_length() + 7) // 8), 'big')
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if isinstance(data, list):
+        data = b''.join(data)
+    eid = eid.to_bytes((eid.bit_length() + 7) // 8, 'big')
+    return eid + (0x0100000000000000 | len(data)).to_bytes(8, 'big') + data
+
+def mkv_sample(path):
+    M = matroska
+    header = ebml_element(M.EBML_ID_HEADER, [ebml_element(M.EBML_ID_DOCTYPE, 'matroska')])
+    info = ebml_element(M.MKV_ID_INFO, [
+        ebml_element(M.MKV_ID_TIMECODESCALE, 1000000),
+        ebml_element(M.MKV_ID_DURATION, struct.pack('>d', 5000.0)),
+        ebml_element(M.MKV_ID_TITLE, 'Sample'),
+    ])
+    tracks = ebml_element(M.MKV_ID_TRACKS, [
+        ebml_element(M.MKV_ID_TRACKENTRY, [
+            ebml_element(M.MKV_ID_TRACKNUMBER, 1),
+            ebml_element(M.MKV_ID_TRACKUID, 101),
+            ebml_element(M.MKV_ID_TRACKTYPE, 1),
+            ebml_element(M.MKV_ID_CODECID, 'V_MPEG4/ISO/AVC'),
+            ebml_element(M.MKV_ID_VIDEO, [
+                ebml_element(M.MKV_ID_PIXELWIDTH, 1920),
+                ebml_element(M.MKV_ID_PIXELHEIGHT, 1080),
+            ]),
+        ]),
+        ebml_element(M.MKV_ID_TRACKENTRY, [
+            ebml_element(M.MKV_ID_TRACKNUMBER, 2),
+            ebml_element(M.MKV_ID_TRACKUID, 102),
+            ebml_element(M.MKV_ID_TRACKTYPE, 2),
+            ebml_element(M.MKV_ID_CODECID, 'A_AAC/MPEG4/LC'),
+            ebml_element(M.MKV_ID_LANGUAGE, 'jpn'),
+            ebml_element(M.MKV_ID_NAME, 'Stereo'),
+            ebml_element(M.MKV_ID_AUDIO, [ebml_element(M.MKV_ID_CHANNELS, 2)]),
+        ]),
+        ebml_element(M.MKV_ID_TRACKENTRY, [
+            ebml_element(M.MKV_ID_TRACKNUMBER, 3),
+            ebml_element(M.MKV_ID_TRACKUID, 103),
+            ebml_element(M.MKV_ID_TRACKTYPE, 17),
+            ebml_element(M.MKV_ID_CODECID, 'S_TEXT/UTF8'),
+            ebml_element(M.MKV_ID_LANGUAGE, 'und'),
+            ebml_element(M.MKV_ID_FLAGDEFAULT, 0),
+        ]),
+    ])
+    cluster = ebml_element(M.MKV_ID_CLUSTER, bytes(32))
+    tags = ebml_element(M.MKV_ID_TAGS, [
+        ebml_element(M.MKV_ID_TAG, [
+            ebml_element(M.MKV_ID_TARGETS, [ebml_element(M.MKV_ID_TAGTRACKUID, 102)]),
+            ebml_element(M.MKV_ID_SIMPLETAG, [
+                ebml_element(M.MKV_ID_TAGNAME, 'BPS'),
+                ebml_element(M.MKV_ID_TAGSTRING, '128000'),
+            ]),
+            ebml_element(M.MKV_ID_SIMPLETAG, [
+                ebml_element(M.MKV_ID_TAGNAME, 'BPS'),
+                ebml_element(M.MKV_ID_TAGSTRING, '128000'),
+                ebml_element(M.MKV_ID_TAGLANGUAGE, 'eng'),
+            ]),
+            ebml_element(M.MKV_ID_SIMPLETAG, [
+                ebml_element(M.MKV_ID_TAGNAME, 'DURATION'),
+                ebml_element(M.MKV_ID_TAGSTRING, '00:00:05.000000000'),
+                ebml_element(M.MKV_ID_TAGLANGUAGE, 'und'),
+            ]),
+        ]),
+    ])
+    seek = lambda eid, pos: ebml_element(M.MKV_ID_SEEK, [
+        ebml_element(M.MKV_ID_SEEKID, eid),
+        ebml_element(M.MKV_ID_SEEKPOSITION, pos.to_bytes(8, 'big')),
+    ])
+    seekhead_size = len(ebml_element(M.MKV_ID_SEEKHEAD, [seek(M.MKV_ID_TRACKS, 0), seek(M.MKV_ID_TAGS, 0)]))
+    seekhead = ebml_element(M.MKV_ID_SEEKHEAD, [
+        seek(M.MKV_ID_TRACKS, seekhead_size + len(info)),
+        seek(M.MKV_ID_TAGS, seekhead_size + len(info) + len(tracks) + len(cluster)),
+    ])
+    segment = ebml_element(M.MKV_ID_SEGMENT, [seekhead, info, tracks, cluster, tags])
+    with open(path, 'wb') as f:
+        f.write(header + segment)
+
+def test_matroska_read_probe():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.mkv')
+        mkv_sample(path)
+        probe = matroska.read_probe(path)
+        assert(probe['format']['format_name'] == 'matroska,webm')
+        assert(probe['format']['duration'] == '5.000000')
+        assert(probe['format']['tags'] == { 'title': 'Sample' })
+        video, audio, subtitle = probe['streams']
+        assert(video['codec_type'] == 'video' and video['codec_name'] == 'h264')
+        assert(video['width'] == 1920 and video['height'] == 1080)
+        assert(video['tags'] == { 'language': 'eng' })
+        assert(audio['codec_type'] == 'audio' and audio['codec_name'] == 'aac')
+        assert(audio['channels'] == 2)
+        assert(audio['tags'] == { 'language': 'jpn', 'title': 'Stereo', 'BPS': '128000', 'BPS-eng': '128000',
+            'DURATION': '00:00:05.000000000' })
+        assert(subtitle['codec_name'] == 'subrip' and subtitle['tags'] == {})
+        assert(subtitle['disposition']['default'] == 0)
+
+        # Media objects use the native parser for Matroska files
+        m = Media(path)
+        assert(m.is_format('matroska'))
+        assert([s.get_info()['codec_type'] for s in m.get_streams()] == ['video', 'audio', 'subtitle'])
+
+def test_matroska_probe_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = tmp
+        try:
+            cache = ProbeCache()
+        finally:
+            if cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache_home
+        path = os.path.join(tmp, 'sample.mkv')
+        mkv_sample(path)
+        previous_cache = get_probe_cache()
+        read_probe = matroska.read_probe
+        set_probe_cache(cache)
+        try:
+            # Native probes are cached, tagged with their source
+            Media(path).get_streams()
+            assert(cache.get(path, 'probe')['source'] == 'matroska')
+
+            # So probing again does not read the file
+            def fail(path):
+                raise AssertionError(f'Unexpected read of {path}')
+            matroska.read_probe = fail
+            m = Media(path)
+            assert([s.get_info()['codec_type'] for s in m.get_streams()] == ['video', 'audio', 'subtitle'])
+            assert(m.audio_streams[0].get_info()['tags']['BPS-eng'] == '128000')
+            assert(m.ffprobe_result is None)
+
+            # Queries on complete keys are answered from the index, others need probing
+            samples = [
+                (['codec_name=aac', 'tags.BPS-eng=128000'], True),
+                (['codec_type=subtitle', '!tags.language'], True),
+                (['width>=1920', 'format.duration>10'], False),
+                (['disposition.default=0'], True),
+                (['bit_rate>0'], None),
+                (['format.tags.creation_time'], None),
+                (['disposition.attached_pic=1'], None),
+            ]
+            for queries, expected in samples:
+                check = filter_cached(list(map(parse_query, queries)))
+                assert(check(Media(path)) == expected), queries
+        finally:
+            matroska.read_probe = read_probe
+            set_probe_cache(previous_cache)
+            cache.conn.close()
+
+def test_matroska_write_track_languages():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.mkv')
+        mkv_sample(path)
+        size = os.path.getsize(path)
+        languages = lambda: [s['tags'].get('language') for s in matroska.read_probe(path)['streams']]
+
+        # Tracks are rewritten in place, padded with a void element
+        assert(matroska.write_track_languages(path, { 1: 'eng', 2: 'spa' }))
+        assert(languages() == ['eng', 'eng', 'spa'])
+        assert(os.path.getsize(path) == size)
+
+        # Tracks exceeding their original space are moved to the end of the segment
+        data = open(path, 'rb').read()
+        assert(matroska.write_track_languages(path, { 0: 'x' * 200 }, dry_run=True))
+        assert(not matroska.write_track_languages(path, { 3: 'eng' }, dry_run=True))
+        assert(open(path, 'rb').read() == data)
+        assert(matroska.write_track_languages(path, { 0: 'x' * 200 }))
+        assert(languages() == ['x' * 200, 'eng', 'spa'])
+        assert(os.path.getsize(path) > size)
+        assert(matroska.write_track_languages(path, { 0: 'jpn' }))
+        assert(languages() == ['jpn', 'eng', 'spa'])
+        assert(not matroska.write_track_languages(path, { 3: 'eng' }))
+
+        # Languages are stored as ISO 639-2/B codes
+        assert(matroska.write_track_languages(path, { 0: 'deu', 1: 'zho', 2: 'ger' }))
+        assert(languages() == ['ger', 'chi', 'ger'])
+
+def test_formats():
+    test_avi_read_stream_chunk()
+    test_avi_write_info_tags()
+    test_mp4_write_track_languages()
+    test_matroska_read_probe()
+    test_matroska_probe_cache()
+    test_matroska_write_track_languages()
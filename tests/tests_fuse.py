@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import tempfile
+
+from curator.formats import matroska
+from curator.media import Media
+from curator.plans.fuse import FusedTagTask, FusedTask, plan_fuse
+from curator.stream import Stream
+from tests.tests_formats import mkv_sample
+
+class StubConvert:
+    def __init__(self, dropped, unpacking):
+        self.dropped = dropped
+        self.unpacking = unpacking
+        self.warnings = set()
+        self.errors = set()
+
+    def needs_unpacking(self):
+        return self.unpacking
+
+    def dropped_streams(self):
+        return self.dropped
+
+    def input_args(self):
+        return ['-f', 'avi', '-i', 'pipe:0']
+
+    def codec_args(self):
+        return ['-c:v', 'libx264']
+
+def sample_media(path, codec_types):
+    m = Media(path, Media.TYPE_FILE)
+    m.info = { 'format_name': 'avi' if m.ext == 'avi' else 'matroska,webm', 'tags': {} }
+    m.load_streams([Stream(m, index, { 'index': index, 'codec_type': codec_type, 'tags': {} })
+        for index, codec_type in enumerate(codec_types)])
+    return m
+
+def test_fuse_command():
+    main = sample_media('/media/a.mkv', ['video', 'audio', 'subtitle'])
+    subs = sample_media('/media/a.srt', ['subtitle'])
+
+    # Streams of related inputs are mapped after those of the main input
+    task = FusedTask([main, subs], main, 'mkv', False)
+    task.select_streams(None, [], subs.streams)
+    task.add_update(subs.streams[0], 'language', None, 'eng')
+    task.add_update(main.streams[1], 'language', 'und', 'jpn')
+    assert(task.command('out.mkv') == ['ffmpeg', '-i', '/media/a.mkv', '-i', '/media/a.srt',
+        '-c', 'copy', '-map', '0:0', '-map', '0:1', '-map', '0:2', '-map', '1:0', '-map_metadata', '0',
+        '-metadata:s:3', 'language=eng', '-metadata:s:1', 'language=jpn', 'out.mkv'])
+
+def test_fuse_input_index():
+    main = sample_media('/media/a.avi', ['video', 'data', 'audio', 'audio'])
+    subs = sample_media('/media/a.srt', ['subtitle'])
+    output = Media('/media/a.mkv', Media.TYPE_FILE)
+
+    # Unpacked main inputs lack the dropped streams, so later streams shift
+    task = FusedTask([main, subs], output, 'mkv', False, StubConvert({1}, True))
+    task.select_streams(None, [], subs.streams)
+    assert([task.input_index(s) for s in task.selected_streams] == [0, 1, 2, 0])
+    task.add_update(main.streams[3], 'language', None, 'spa')
+    assert(task.command('out.mkv') == ['ffmpeg', '-f', 'avi', '-i', 'pipe:0', '-i', '/media/a.srt',
+        '-c:v', 'libx264', '-map', '0:0', '-map', '0:1', '-map', '0:2', '-map', '1:0', '-map_metadata', '0',
+        '-metadata:s:2', 'language=spa', '-movflags', 'use_metadata_tags', 'out.mkv'])
+
+    # Otherwise streams keep their indices
+    task = FusedTask([main, subs], output, 'mkv', False, StubConvert({1}, False))
+    task.select_streams(None, [], subs.streams)
+    assert([task.input_index(s) for s in task.selected_streams] == [0, 2, 3, 0])
+
+def test_fuse_tag_in_place():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.mkv')
+        mkv_sample(path)
+        size = os.path.getsize(path)
+
+        # Matroska inputs only needing tag updates are not rewritten with ffmpeg
+        plan = plan_fuse([Media(path)], 'mkv', stype='audio', tag='language', value='spa')
+        assert(len(plan.tasks) == 1)
+        task = plan.tasks[0]
+        assert(isinstance(task, FusedTagTask))
+        assert([(u.index, u.tag, u.old, u.new) for u in task.updates] == [(1, 'language', 'jpn', 'spa')])
+        if not task.path_mkvpropedit:
+            assert(task.required_space() == [])
+        task.apply()
+        assert(matroska.read_probe(path)['streams'][1]['tags']['language'] == 'spa')
+        assert(os.path.getsize(path) == size)
+
+def test_fuse():
+    test_fuse_command()
+    test_fuse_input_index()
+    test_fuse_tag_in_place()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+
+from curator.journal import Journal, get_journal, set_journal
+from curator.task import Task
+from curator.util import TEMP_PREFIX, temp_directory
+
+class FileMedia:
+    def __init__(self, path):
+        self.path = path
+        self.dir = os.path.dirname(path)
+
+class AppendTask(Task):
+    def view(self):
+        return [(self.inputs[0].path, '→', self.outputs[0].path)]
+
+    def apply(self):
+        with open(self.outputs[0].path, 'a') as f:
+            f.write('merged')
+
+class ReplaceTask(AppendTask):
+    def apply(self):
+        output = self.outputs[0]
+        with temp_directory(output.dir) as tmp:
+            output_tmp = os.path.join(tmp, 'output')
+            with open(output_tmp, 'w') as f:
+                f.write('merged')
+            self.commit()
+            os.replace(output_tmp, output.path)
+
+def dead_pid():
+    proc = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True)
+    return int(proc.stdout)
+
+@contextlib.contextmanager
+def journal_sample():
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['XDG_CACHE_HOME'] = os.path.join(tmp, 'cache')
+        journal = Journal()
+        try:
+            yield journal, tmp
+        finally:
+            journal.conn.close()
+            if cache_home is None:
+                os.environ.pop('XDG_CACHE_HOME')
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache_home
+
+def test_journal_in_place_task():
+    with journal_sample() as (journal, tmp):
+        path = os.path.join(tmp, 'a.mkv')
+        with open(path, 'w') as f:
+            f.write('video')
+
+        # Tasks modifying their own input are completed once applied
+        task = AppendTask([FileMedia(path)], [FileMedia(path)])
+        key = journal.start(task)
+        assert(not journal.is_completed(task))
+        task.apply()
+        journal.finish(key, task)
+        assert(journal.is_completed(AppendTask([FileMedia(path)], [FileMedia(path)])))
+
+        # Until their files change again
+        with open(path, 'a') as f:
+            f.write('edited')
+        assert(not journal.is_completed(AppendTask([FileMedia(path)], [FileMedia(path)])))
+
+def test_journal_recover():
+    with journal_sample() as (journal, tmp):
+        input_path = os.path.join(tmp, 'a.avi')
+        output_path = os.path.join(tmp, 'a.mkv')
+        with open(input_path, 'w') as f:
+            f.write('video')
+        task = AppendTask([FileMedia(input_path)], [FileMedia(output_path)])
+        journal.start(task)
+        with open(output_path, 'w') as f:
+            f.write('partial')
+
+        # Tasks of running processes are left untouched
+        own_temp = os.path.join(tmp, f'{TEMP_PREFIX}{os.getpid()}-own')
+        os.mkdir(own_temp)
+        assert(journal.recover() == 0)
+        assert(os.path.exists(output_path))
+
+        # Otherwise their partial outputs and temporary directories are removed
+        pid = dead_pid()
+        with journal.lock:
+            journal.conn.execute('UPDATE tasks SET pid=?', (pid,))
+            journal.conn.commit()
+        dead_temp = os.path.join(tmp, f'{TEMP_PREFIX}{pid}-dead')
+        os.mkdir(dead_temp)
+        assert(journal.recover() == 1)
+        assert(not os.path.exists(output_path) and not os.path.exists(dead_temp))
+        assert(os.path.exists(input_path) and os.path.exists(own_temp))
+
+def test_journal_recover_committed():
+    with journal_sample() as (journal, tmp):
+        input_path = os.path.join(tmp, 'a.avi')
+        output_path = os.path.join(tmp, 'a.mkv')
+        with open(input_path, 'w') as f:
+            f.write('video')
+
+        # Tasks interrupted after moving their outputs into place, but before finishing
+        task = ReplaceTask([FileMedia(input_path)], [FileMedia(output_path)])
+        previous_journal = get_journal()
+        set_journal(journal)
+        try:
+            journal.start(task)
+            task.apply()
+        finally:
+            set_journal(previous_journal)
+        with journal.lock:
+            journal.conn.execute('UPDATE tasks SET pid=?', (dead_pid(),))
+            journal.conn.commit()
+
+        # Keep their complete outputs, and are no longer tracked
+        assert(journal.recover() == 1)
+        assert(open(output_path).read() == 'merged')
+        assert(not journal.is_completed(task))
+        assert(journal.recover() == 0)
+
+def test_journal():
+    test_journal_in_place_task()
+    test_journal_recover()
+    test_journal_recover_committed()
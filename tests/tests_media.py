@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import tempfile
+
+from curator.media import media_paths, media_scan
+
+def test_media_scan_extensions():
+    with tempfile.TemporaryDirectory() as tmp:
+        names = ['a.mkv', 'b.MKA', 'c.webm', 'd.flac', 'e.ac3', 'f.srt', 'g.txt', 'h.nfo']
+        for name in names:
+            open(os.path.join(tmp, name), 'w').close()
+
+        # Files of every container and codec accepted by plans are scanned
+        media = list(media_scan(tmp))
+        assert([m.name for m in media] == names[:6])
+
+def test_media_scan_symlinks():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'root')
+        season = os.path.join(root, 'season')
+        os.makedirs(season)
+        open(os.path.join(root, 'a.mkv'), 'w').close()
+        open(os.path.join(season, 'b.mkv'), 'w').close()
+        try:
+            os.symlink(root, os.path.join(season, 'loop'), target_is_directory=True)
+            os.symlink(season, os.path.join(root, 'link'), target_is_directory=True)
+        except (NotImplementedError, OSError):
+            return
+
+        # Symbolic link loops terminate and directories are only scanned once
+        paths = [m.path for m in media_paths([root], recursive=True)]
+        assert(paths == [os.path.join(root, 'a.mkv'), os.path.join(root, 'link', 'b.mkv')])
+
+        # Without recursion, subdirectories are skipped
+        paths = [m.path for m in media_paths([root])]
+        assert(paths == [os.path.join(root, 'a.mkv')])
+
+def test_media():
+    test_media_scan_extensions()
+    test_media_scan_symlinks()
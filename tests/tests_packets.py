@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from curator import packets
+
+def test_parse_flags():
+    assert(packets.parse_flags('K__') == packets.FLAG_KEY)
+    assert(packets.parse_flags('_D_') == packets.FLAG_DISCARD)
+    assert(packets.parse_flags('KDC') == packets.FLAG_KEY | packets.FLAG_DISCARD | packets.FLAG_CORRUPT)
+    assert(packets.parse_flags('__') == 0)
+
+def test_parse_index():
+    # Packets spanning several chunks, with unavailable fields
+    rows = packets.INDEX_CHUNK_ROWS + 3
+    lines = [f'pts={i * 1001}|dts=N/A|duration=1001|size={100 + i}|pos=|flags={"K_" if i % 10 == 0 else "__"}\n'
+        for i in range(rows)]
+    index = packets.parse_index(['\n'] + lines)
+    assert(index.dtype == packets.INDEX_DTYPE)
+    assert(len(index) == rows)
+    assert(index['pts'][-1] == (rows - 1) * 1001 and index['size'][-1] == 100 + rows - 1)
+    assert(np.all(index['dts'] == packets.NOPTS) and np.all(index['pos'] == packets.NOPTS))
+    assert(np.count_nonzero(index['flags'] & packets.FLAG_KEY) == (rows + 9) // 10)
+
+    # Frames, mapping their keys into the same columns
+    index = packets.parse_index([
+        'key_frame=1|pts=0|pkt_dts=0|duration=N/A|pkt_duration=40|pkt_pos=48|pkt_size=512',
+        'key_frame=0|pts=N/A|pkt_dts=40|duration=40|pkt_pos=N/A|pkt_size=128',
+    ])
+    assert(index['flags'].tolist() == [packets.FLAG_KEY, 0])
+    assert(index['pts'].tolist() == [0, packets.NOPTS])
+    assert(index['dts'].tolist() == [0, 40])
+    assert(index['duration'].tolist() == [40, 40])
+    assert(index['pos'].tolist() == [48, packets.NOPTS])
+    assert(index['size'].tolist() == [512, 128])
+    assert(len(packets.parse_index([])) == 0)
+
+def test_store_index():
+    class Cache:
+        pass
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Cache()
+        cache.cache = os.path.join(tmp, 'cache')
+        path = os.path.join(tmp, 'a.mkv')
+        with open(path, 'wb') as f:
+            f.write(b'video')
+        index = packets.parse_index(['pts=0|dts=0|duration=1|size=1|pos=0|flags=K_'])
+        old_path = packets.index_cache_path(cache, path, 0, 'packet')
+        packets.store_index(old_path, index)
+        packets.store_index(packets.index_cache_path(cache, path, 1, 'packet'), index)
+
+        # Indices of modified files replace previous ones of the same stream
+        with open(path, 'ab') as f:
+            f.write(b'changed')
+        new_path = packets.index_cache_path(cache, path, 0, 'packet')
+        assert(new_path != old_path)
+        packets.store_index(new_path, index)
+        assert(not os.path.exists(old_path) and os.path.exists(new_path))
+        assert(len(os.listdir(os.path.dirname(new_path))) == 2)
+        assert(np.load(new_path, mmap_mode='r')['flags'][0] == packets.FLAG_KEY)
+
+def test_packets():
+    test_parse_flags()
+    test_parse_index()
+    test_store_index()
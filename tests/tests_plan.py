@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import tempfile
+import threading
+
+from curator.plan import Plan
+from curator.task import Task
+
+class FileMedia:
+    def __init__(self, path):
+        self.path = path
+        self.dir = os.path.dirname(path)
+
+    def __str__(self):
+        return self.path
+
+class StubTask(Task):
+    def __init__(self, path, log, barrier=None, error=None):
+        super().__init__([FileMedia(path)], [])
+        self.log = log
+        self.barrier = barrier
+        self.error = error
+
+    def apply(self):
+        self.log.start(self)
+        try:
+            if self.barrier:
+                self.barrier.wait()
+            if self.error:
+                raise Exception(self.error)
+        finally:
+            self.log.stop(self)
+
+class StubLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.order = []
+        self.running = {}
+        self.max_running = 0
+        self.max_running_path = 0
+
+    def start(self, task):
+        path = task.inputs[0].path
+        with self.lock:
+            self.order.append(task.id)
+            self.running[path] = self.running.get(path, 0) + 1
+            self.max_running = max(self.max_running, sum(self.running.values()))
+            self.max_running_path = max(self.max_running_path, self.running[path])
+
+    def stop(self, task):
+        with self.lock:
+            self.running[task.inputs[0].path] -= 1
+
+def test_plan_apply_concurrent():
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = os.path.join(tmp, 'a.mkv'), os.path.join(tmp, 'b.mkv')
+
+        # Tasks on disjoint files run concurrently, otherwise the barrier breaks
+        log = StubLog()
+        barrier = threading.Barrier(2, timeout=5)
+        plan = Plan()
+        plan.add_task(StubTask(a, log, barrier))
+        plan.add_task(StubTask(b, log, barrier))
+        plan.apply(jobs=2)
+        assert(not any(task.failed for task in plan))
+        assert(log.max_running == 2)
+
+        # Tasks sharing files run one at a time in plan order
+        log = StubLog()
+        plan = Plan()
+        for path in (a, a, b, a, b):
+            plan.add_task(StubTask(path, log))
+        plan.apply(jobs=4)
+        assert(not any(task.failed for task in plan))
+        assert(log.max_running_path == 1)
+        assert([i for i in log.order if i in (1, 2, 4)] == [1, 2, 4])
+        assert([i for i in log.order if i in (3, 5)] == [3, 5])
+
+def test_plan_apply_serial():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = StubLog()
+        plan = Plan()
+        for name in ('a.mkv', 'b.mkv', 'c.mkv'):
+            plan.add_task(StubTask(os.path.join(tmp, name), log))
+        plan.apply()
+        assert(log.order == [1, 2, 3] and log.max_running == 1)
+
+def test_plan_apply_failures():
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = os.path.join(tmp, 'a.mkv'), os.path.join(tmp, 'b.mkv')
+
+        # Failed tasks do not prevent remaining tasks from running
+        log = StubLog()
+        plan = Plan()
+        plan.add_task(StubTask(a, log, error='Failed on purpose'))
+        plan.add_task(StubTask(a, log))
+        plan.add_task(StubTask(b, log))
+        plan.tasks[2].enabled = False
+        plan.apply(jobs=2)
+        assert([task.failed for task in plan] == [True, False, False])
+        assert(sorted(log.order) == [1, 2])
+
+def test_plan():
+    test_plan_apply_concurrent()
+    test_plan_apply_serial()
+    test_plan_apply_failures()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Curator.
+"""
+
+import os
+import tempfile
+
+from curator.cache import ProbeCache
+from curator.query import *
+
+PROBE_SAMPLE = {
+    'format': { 'format_name': 'matroska,webm', 'duration': '5400.000000' },
+    'streams': [
+        { 'index': 0, 'codec_type': 'video', 'codec_name': 'hevc', 'width': 1920,
+          'avg_frame_rate': '24000/1001', 'tags': {} },
+        { 'index': 1, 'codec_type': 'audio', 'codec_name': 'ac3', 'channels': 6,
+          'tags': { 'language': 'eng' } },
+        { 'index': 2, 'codec_type': 'subtitle', 'codec_name': 'subrip',
+          'tags': { 'title': 'English (Commentary)' } },
+    ],
+}
+
+QUERY_SAMPLES = [
+    # Stream-level queries
+    (['codec_name=hevc'], True),
+    (['codec_name!=hevc'], True),
+    (['codec_name in h264,hevc'], True),
+    (['codec_name in h264,vp9'], False),
+    (['width>=1920'], True),
+    (['width>1920'], False),
+    (['avg_frame_rate<24'], True),
+    (['channels<=2'], False),
+    (['tags.title~=(?i)commentary'], True),
+    (['tags.language'], True),
+    (['!tags.language'], True),
+    (['codec_type=audio', 'tags.language=eng'], True),
+    (['codec_type=audio', '!tags.language'], False),
+    (['codec_type=subtitle', 'tags.language=eng'], False),
+    # Media-level queries
+    (['format.format_name=matroska,webm'], True),
+    (['format.duration>3600', 'codec_name=ac3'], True),
+    (['format.format_name~=^avi'], False),
+]
+
+def test_query_match():
+    for queries, expected in QUERY_SAMPLES:
+        queries = list(map(parse_query, queries))
+        streams = PROBE_SAMPLE['streams']
+        matched = True
+        for query in queries:
+            if query.media_level:
+                matched &= query.match(PROBE_SAMPLE['format'])
+            else:
+                streams = [s for s in streams if query.match(s)]
+        matched &= len(streams) > 0
+        assert matched == expected, queries
+
+def test_query_cache_select():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = tmp
+        try:
+            cache = ProbeCache()
+        finally:
+            if cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache_home
+        path = os.path.join(tmp, 'sample.mkv')
+        open(path, 'wb').close()
+        cache.put(path, 'probe', PROBE_SAMPLE)
+        for queries, expected in QUERY_SAMPLES:
+            identities, matches = cache.select(list(map(parse_query, queries)))
+            assert os.path.abspath(path) in identities
+            assert (os.path.abspath(path) in matches) == expected, queries
+        cache.conn.close()
+
+def test_query():
+    test_query_match()
+    test_query_cache_select()
@@ -6,6 +6,9 @@ Curator.
 
 from curator.media import *
 from curator.stream import *
+from curator.vad import *
+
+import numpy as np
 
 def test_detect_subtitle_language():
     srt_lang = lambda path: Media(path).get_streams()[0].detect_subtitle_language()
@@ -20,5 +23,65 @@ def test_detect_subtitle_language():
     assert(srt_lang("tests/samples/the_godfather_1972.pt.srt") == 'por')
     assert(srt_lang("tests/samples/the_godfather_1972.zh.srt") == 'zho')
 
+def test_srt_language():
+    assert(srt_language("tests/samples/the_godfather_1972.da.srt") == 'dan')
+    assert(srt_language("tests/samples/the_godfather_1972.en.srt") == 'eng')
+    assert(srt_language("tests/samples/the_godfather_1972.es.srt") == 'spa')
+    assert(srt_language("tests/samples/the_godfather_1972.fr.srt") == 'fra')
+    assert(srt_language("tests/samples/the_godfather_1972.he.srt") == 'heb')
+    assert(srt_language("tests/samples/the_godfather_1972.it.srt") == 'ita')
+    assert(srt_language("tests/samples/the_godfather_1972.ko.srt") == 'kor')
+    assert(srt_language("tests/samples/the_godfather_1972.pl.srt") == 'pol')
+    assert(srt_language("tests/samples/the_godfather_1972.pt.srt") == 'por')
+    assert(srt_language("tests/samples/the_godfather_1972.zh.srt") == 'zho')
+
+def test_select_speech_windows():
+    # Silence at 100 Hz frames with speech at 60-100s and 250-300s out of 400s
+    envelope = np.full(40000, 1e-6)
+    envelope[6000:10000] = 1e-2
+    envelope[25000:30000] = 1e-2
+    offsets = select_speech_windows(envelope, 30, 4)
+    assert(60 in offsets and 250 in offsets)
+    for offset in offsets:
+        assert(np.mean(envelope[int(offset * 100):int(offset * 100) + 3000] > 1e-4) >= 0.2)
+    assert(all(b - a >= 30 for a, b in zip(offsets, offsets[1:])))
+    # Without speech, the densest window is still returned
+    assert(len(select_speech_windows(np.full(40000, 1e-6), 30, 4)) == 1)
+    assert(select_speech_windows(np.full(1000, 1e-6), 30, 4) == [])
+
+# Windows voting for a language, remaining windows, options and whether the language is settled
+SETTLED_SAMPLES = [
+    # No votes reach the minimum score
+    ([{ 'en': 0.5, 'es': 0.4 }] * 3, 7, {}, False),
+    # Confident single language, unless there are not enough windows
+    ([{ 'en': 0.99 }] * 3, 7, {}, True),
+    ([{ 'en': 0.99 }] * 2, 8, {}, False),
+    ([{ 'en': 0.99 }] * 3, 7, { 'adaptive_confidence': 0.995 }, False),
+    # Leader cannot be overtaken by remaining windows
+    ([{ 'en': 0.9 }] * 8 + [{ 'es': 0.85 }], 1, {}, True),
+    ([{ 'en': 0.9 }] * 4 + [{ 'es': 0.85 }], 5, {}, False),
+    # Ties are never settled, not even without remaining windows
+    ([{ 'en': 0.9 }, { 'es': 0.9 }] * 2, 0, {}, False),
+    ([{ 'id': 0.9 }, { 'ms': 0.9 }] * 2 + [{ 'en': 0.9 }], 0, {}, False),
+    # Unless both languages belong to the same macrolanguage
+    ([{ 'id': 0.9 }, { 'ms': 0.9 }] * 2 + [{ 'en': 0.9 }], 0, { 'only_macrolanguages': True }, True),
+]
+
+def test_audio_language_settled():
+    for probs, remaining, opts, expected in SETTLED_SAMPLES:
+        opts = { **DEF_OPTS_LANGUAGE, 'adaptive_sampling': True, **opts }
+        assert(audio_language_settled(probs, remaining, opts) == expected), (probs, remaining, opts)
+
+def test_spread_order():
+    for count in range(40):
+        order = spread_order(count)
+        assert(sorted(order) == list(range(count)))
+        assert(count == 0 or order[0] == count // 2)
+    assert(spread_order(5) == [2, 0, 4, 1, 3])
+
 def test_stream():
     test_detect_subtitle_language()
+    test_srt_language()
+    test_select_speech_windows()
+    test_audio_language_settled()
+    test_spread_order()